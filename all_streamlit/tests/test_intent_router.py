@@ -0,0 +1,44 @@
+import numpy as np
+
+from text2sql.backend.config import IntentRouterSettings
+from text2sql.backend.core.intent_router import IntentRouter
+
+
+def make_examples(similarities: list[float], dim: int = 16) -> np.ndarray:
+    # Unit vectors whose similarity to the first axis is the given value
+    examples = np.zeros((len(similarities), dim), dtype=np.float32)
+    for i, similarity in enumerate(similarities):
+        examples[i, 0] = similarity
+        examples[i, i + 1] = np.sqrt(1 - similarity**2)
+    return examples
+
+
+def make_router(similarities: list[float], labels: list[float]) -> IntentRouter:
+    router = IntentRouter(config=IntentRouterSettings())
+    examples = make_examples(similarities)
+    router._get_examples = lambda: (examples, np.asarray(labels, dtype=np.float32))
+    return router
+
+
+def test_sql_neighbours_outvote_a_weaker_non_sql_neighbour():
+    # Far more SQL than non-SQL examples in the reference set must not tip the vote
+    router = make_router(
+        [0.92, 0.92, 0.92, 0.92, 0.85] + [0.1] * 10,
+        [1.0, 1.0, 1.0, 1.0, 0.0] + [1.0] * 10,
+    )
+    query = np.eye(16, dtype=np.float32)[0]
+
+    sql_required, confidence = router._classify(query.tolist())
+
+    assert sql_required is True
+    assert confidence > router.config.min_margin
+
+
+def test_split_neighbours_fall_back_to_the_llm():
+    router = make_router([0.9, 0.9, 0.9, 0.9, 0.9], [1.0, 1.0, 0.0, 0.0, 1.0])
+    query = np.eye(16, dtype=np.float32)[0]
+
+    sql_required, confidence = router._classify(query.tolist())
+
+    assert sql_required is None
+    assert confidence < router.config.min_margin
@@ -0,0 +1,208 @@
+import datetime
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+
+from text2sql.backend.config import ChatAnalyticsSettings, settings
+from text2sql.backend.connectors.postgres import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+partition_pattern = re.compile(r"^chat_history_(\d{4})_(\d{2})$")
+
+refresh_rollup_query = """
+INSERT INTO chat_history_daily (
+    day, email, questions, sessions, cache_hits, latency_ms_sum, latency_count,
+    prompt_tokens, completion_tokens, feedback_count, updated_at
+)
+SELECT
+    h.created_at::DATE,
+    h.email,
+    COUNT(*),
+    COUNT(DISTINCT h.session_id),
+    COUNT(*) FILTER (WHERE h.cache_hit),
+    COALESCE(SUM(h.latency_ms), 0),
+    COUNT(h.latency_ms),
+    COALESCE(SUM(h.prompt_tokens), 0),
+    COALESCE(SUM(h.completion_tokens), 0),
+    COALESCE(SUM(f.feedback_count), 0),
+    CURRENT_TIMESTAMP
+FROM chat_history h
+LEFT JOIN (
+    SELECT chat_id, COUNT(*) AS feedback_count
+    FROM user_feedback
+    WHERE chat_id IN (SELECT chat_id FROM chat_history WHERE created_at >= %(since)s)
+    GROUP BY chat_id
+) f ON f.chat_id = h.chat_id
+WHERE h.created_at >= %(since)s
+GROUP BY 1, 2
+ON CONFLICT (day, email) DO UPDATE SET
+    questions = EXCLUDED.questions,
+    sessions = EXCLUDED.sessions,
+    cache_hits = EXCLUDED.cache_hits,
+    latency_ms_sum = EXCLUDED.latency_ms_sum,
+    latency_count = EXCLUDED.latency_count,
+    prompt_tokens = EXCLUDED.prompt_tokens,
+    completion_tokens = EXCLUDED.completion_tokens,
+    feedback_count = EXCLUDED.feedback_count,
+    updated_at = EXCLUDED.updated_at
+"""
+
+rollup_columns = """
+    SUM(questions) AS questions,
+    SUM(sessions) AS sessions,
+    SUM(cache_hits)::FLOAT / NULLIF(SUM(questions), 0) AS cache_hit_rate,
+    SUM(latency_ms_sum)::FLOAT / NULLIF(SUM(latency_count), 0) AS avg_latency_ms,
+    SUM(prompt_tokens) AS prompt_tokens,
+    SUM(completion_tokens) AS completion_tokens,
+    SUM(feedback_count) AS feedback_count
+"""
+
+
+def get_month_start(day: datetime.date, months: int = 0) -> datetime.date:
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def create_partitions(months_ahead: int, today: Optional[datetime.date] = None) -> None:
+    today = today or datetime.date.today()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for i in range(months_ahead + 1):
+                cursor.execute(
+                    "SELECT create_chat_history_partition(%s)", (get_month_start(today, i),)
+                )
+
+
+def drop_expired_partitions(
+    retention_months: int, today: Optional[datetime.date] = None
+) -> list[str]:
+    """Drop monthly partitions that end before the retention window. The daily rollup
+    keeps their totals."""
+    cutoff = get_month_start(today or datetime.date.today(), -retention_months)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'chat_history'::regclass"""
+            )
+            expired = []
+            for (name,) in cursor.fetchall():
+                match = partition_pattern.match(name)
+                if match and datetime.date(int(match[1]), int(match[2]), 1) < cutoff:
+                    expired.append(name)
+
+            for name in expired:
+                cursor.execute(f'DROP TABLE "{name}"')
+            cursor.execute(
+                "DELETE FROM chat_history_default WHERE created_at < %s", (cutoff,)
+            )
+    if expired:
+        logger.info(f"Dropped chat history partitions: {', '.join(expired)}")
+    return expired
+
+
+def refresh_daily_rollup(since: datetime.date) -> None:
+    # Only reads partitions from since onwards, so refreshing recent days stays cheap
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(refresh_rollup_query, {"since": since})
+
+
+def get_rollup_watermark() -> datetime.date | None:
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT MAX(day) FROM chat_history_daily")
+            return cursor.fetchone()[0]
+
+
+def get_refresh_since(today: datetime.date) -> datetime.date:
+    """The first day the rollup needs rebuilding from: the recent days that may still
+    change, or the last rolled up day if the rollup has fallen further behind."""
+    since = today - datetime.timedelta(days=settings.chat_analytics.rollup_refresh_days)
+    watermark = get_rollup_watermark()
+    return min(since, watermark) if watermark is not None else datetime.date.min
+
+
+def maintain_chat_history() -> None:
+    """Create upcoming partitions, bring the daily rollup up to date and apply retention."""
+    config = settings.chat_analytics
+    today = datetime.date.today()
+    create_partitions(config.partitions_ahead, today)
+
+    # Roll up from the last rolled up day before dropping anything, so the totals of
+    # expiring months are kept
+    refresh_daily_rollup(get_refresh_since(today))
+
+    drop_expired_partitions(config.retention_months, today)
+    logger.info("Chat history partitions maintained")
+
+
+class ChatHistoryMaintainer:
+    """Runs maintain_chat_history every maintenance_interval_seconds, so partitions
+    are created ahead of each month and retention is applied while the app runs, not
+    only at deploy time."""
+
+    def __init__(self, config: ChatAnalyticsSettings):
+        self.config = config
+        self._thread = threading.Thread(
+            target=self._run, name="chat-history-maintenance", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.config.maintenance_interval_seconds)
+            try:
+                maintain_chat_history()
+            except Exception as e:
+                # Every step is idempotent, so the next run picks up where this one failed
+                logger.error(f"Chat history maintenance failed: {e}")
+
+
+@lru_cache
+def get_chat_history_maintainer() -> ChatHistoryMaintainer:
+    return ChatHistoryMaintainer(config=settings.chat_analytics)
+
+
+def get_daily_rollup(
+    start: datetime.date, end: datetime.date, email: Optional[str] = None
+) -> pd.DataFrame:
+    """Totals per day between start and end, inclusive, optionally for one user."""
+    return _get_rollup("day", start, end, email)
+
+
+def get_user_rollup(
+    start: datetime.date, end: datetime.date, email: Optional[str] = None
+) -> pd.DataFrame:
+    """Totals per user between start and end, inclusive."""
+    return _get_rollup("email", start, end, email)
+
+
+def _get_rollup(
+    group_by: str, start: datetime.date, end: datetime.date, email: Optional[str]
+) -> pd.DataFrame:
+    since = get_refresh_since(datetime.date.today())
+    if end >= since:
+        # From since rather than start, since a refresh moves the watermark to today and
+        # any days it skipped would never be rolled up
+        refresh_daily_rollup(since)
+
+    email_filter = "AND email = %(email)s" if email is not None else ""
+    query = f"""SELECT {group_by}, {rollup_columns}
+        FROM chat_history_daily
+        WHERE day BETWEEN %(start)s AND %(end)s {email_filter}
+        GROUP BY {group_by}
+        ORDER BY {group_by}"""
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, {"start": start, "end": end, "email": email})
+            columns = [i.name for i in cursor.description]
+            rows = cursor.fetchall()
+    return pd.DataFrame(rows, columns=columns)
@@ -12,6 +12,9 @@ class OpenSearchSettings(BaseSettings):
     port: str = "9200"
     user: str = ""
     password: SecretStr = SecretStr("")
+    bulk_max_bytes: int = 10 * 1024 * 1024
+    bulk_max_concurrency: int = 4
+    bulk_max_retries: int = 3
 
 
 class AzureOpenAISettings(BaseSettings):
@@ -20,6 +23,9 @@ class AzureOpenAISettings(BaseSettings):
     api_version: str = "2024-10-21"
     deployment_chat: str
     deployment_embedding: str
+    deployment_router: str = ""
+    stream_chat: bool = True
+    embedding_model: str = "text-embedding-ada-002"
 
 
 class OAuthSettings(BaseSettings):
@@ -28,6 +34,11 @@ class OAuthSettings(BaseSettings):
     client_id: str
     client_secret: SecretStr
     redirect_uri: str
+    token_refresh_margin_seconds: int = 120
+    token_refresh_check_interval_seconds: int = 30
+    default_token_lifetime_seconds: int = 600
+    # Tokens of users idle this long stop being refreshed and are dropped
+    idle_user_ttl_seconds: int = 8 * 3600
 
 class OllamaSettings(BaseSettings):
     host:str
@@ -39,6 +50,13 @@ class PostgresSettings(BaseSettings):
     host: str
     port: str = "5432"
     aws_secretsmanager_secret_id: str = ""
+    pool_min_connections: int = 1
+    pool_max_connections: int = 10
+    pool_checkout_timeout_seconds: float = 10.0
+    pool_max_lifetime_seconds: int = 30 * 60
+    pool_health_check_after_seconds: int = 30
+    pool_idle_timeout_seconds: int = 5 * 60
+    pool_reap_interval_seconds: int = 60
 
     @model_validator(mode="before")
     def handle_password_missing(self: dict) -> Any:
@@ -56,12 +74,149 @@ class PostgresSettings(BaseSettings):
         return self
 
 
+class SemanticCacheSettings(BaseSettings):
+    enabled: bool = True
+    similarity_threshold: float = 0.95
+    ttl_seconds: int = 24 * 3600
+    max_entries: int = 1000
+    index_check_interval_seconds: int = 60
+
+
+class EmbeddingBatchSettings(BaseSettings):
+    max_items: int = 2048
+    max_tokens: int = 100_000
+    max_input_tokens: int = 8191
+    max_concurrency: int = 4
+    max_retries: int = 6
+
+
+class EmbeddingCacheSettings(BaseSettings):
+    backend: Literal["postgres", "sqlite", "none"] = "postgres"
+    memory_max_entries: int = 10000
+    sqlite_path: str = ".embedding_cache.sqlite3"
+
+
+class IntentRouterSettings(BaseSettings):
+    enabled: bool = True
+    speculative: bool = True
+    n_neighbors: int = 5
+    min_similarity: float = 0.8
+    min_margin: float = 0.6
+    max_verified_examples: int = 200
+    examples_check_interval_seconds: int = 60
+    assumed_llm_latency_ms: float = 1500
+
+
+class PromptBudgetSettings(BaseSettings):
+    model: str = "gpt-4o"
+    max_context_tokens: int = 6000
+    min_item_tokens: int = 50
+
+
+class ResultCacheSettings(BaseSettings):
+    enabled: bool = True
+    ttl_seconds: int = 15 * 60
+    max_memory_bytes: int = 512 * 1024 * 1024
+    max_entry_bytes: int = 64 * 1024 * 1024
+    spill_enabled: bool = False
+    spill_dir: str = ".result_cache"
+    max_disk_bytes: int = 2 * 1024 * 1024 * 1024
+
+
+class SQLValidationSettings(BaseSettings):
+    enabled: bool = True
+    check_tables: bool = True
+    check_columns: bool = True
+    catalog_check_interval_seconds: int = 60
+
+
+class ChartPlannerSettings(BaseSettings):
+    enabled: bool = True
+    max_categories: int = 50
+    max_pie_slices: int = 6
+    max_series: int = 5
+    max_color_groups: int = 10
+
+
+class ChartCacheSettings(BaseSettings):
+    enabled: bool = True
+    max_entries: int = 500
+    ttl_seconds: int = 7 * 24 * 3600
+
+
+class ChartReductionSettings(BaseSettings):
+    enabled: bool = True
+    max_points: int = 5000
+    top_n_categories: int = 20
+    max_series: int = 10
+    webgl_threshold: int = 2000
+
+
+class ChartSandboxSettings(BaseSettings):
+    enabled: bool = True
+    pool_size: int = 2
+    cpu_seconds: int = 5
+    memory_bytes: int = 1024 * 1024 * 1024
+    timeout_seconds: float = 10.0
+    checkout_timeout_seconds: float = 10.0
+
+
+class AuditLogSettings(BaseSettings):
+    enabled: bool = True
+    max_queue_size: int = 10_000
+    batch_size: int = 500
+    flush_interval_seconds: float = 1.0
+    # How long log() waits on a full queue before dropping the row
+    enqueue_timeout_seconds: float = 0.05
+    max_retries: int = 3
+    retry_backoff_seconds: float = 1.0
+    shutdown_timeout_seconds: float = 10.0
+
+
+class ChatAnalyticsSettings(BaseSettings):
+    # Monthly chat_history partitions older than this are dropped
+    retention_months: int = 13
+    partitions_ahead: int = 3
+    # Days before today the daily rollup is rebuilt from chat_history on refresh
+    rollup_refresh_days: int = 1
+    maintenance_interval_seconds: int = 3600
+    # How long recording a question waits for LLM usage still arriving
+    usage_wait_seconds: float = 5.0
+
+
+class SnowflakeSettings(BaseSettings):
+    max_display_rows: int = 5000
+    max_load_more_rows: int = 100_000
+    pool_max_connections_per_user: int = 4
+    pool_checkout_timeout_seconds: int = 30
+    pool_idle_timeout_seconds: int = 600
+    pool_health_check_after_seconds: int = 60
+    pool_reap_interval_seconds: int = 60
+    query_timeout_seconds: int = 300
+    query_poll_interval_seconds: float = 0.25
+    query_max_poll_interval_seconds: float = 2.0
+
+
 class Settings(BaseSettings):
     azure_openai: AzureOpenAISettings
     opensearch: OpenSearchSettings
     oauth: OAuthSettings
     postgres: PostgresSettings
     ollama: OllamaSettings
+    semantic_cache: SemanticCacheSettings = SemanticCacheSettings()
+    embedding_cache: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    embedding_batch: EmbeddingBatchSettings = EmbeddingBatchSettings()
+    intent_router: IntentRouterSettings = IntentRouterSettings()
+    prompt_budget: PromptBudgetSettings = PromptBudgetSettings()
+    snowflake: SnowflakeSettings = SnowflakeSettings()
+    result_cache: ResultCacheSettings = ResultCacheSettings()
+    sql_validation: SQLValidationSettings = SQLValidationSettings()
+    chart_planner: ChartPlannerSettings = ChartPlannerSettings()
+    chart_cache: ChartCacheSettings = ChartCacheSettings()
+    chart_reduction: ChartReductionSettings = ChartReductionSettings()
+    chart_sandbox: ChartSandboxSettings = ChartSandboxSettings()
+    audit_log: AuditLogSettings = AuditLogSettings()
+    chat_analytics: ChatAnalyticsSettings = ChatAnalyticsSettings()
 
     env: Literal["local", "dev", "stg", "prod"] = "local"
 
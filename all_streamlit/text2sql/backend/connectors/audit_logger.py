@@ -0,0 +1,201 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from text2sql.backend.config import AuditLogSettings
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying the same rows for
+transient_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Columns written per audit table, in insert order
+audit_tables: dict[str, tuple[str, ...]] = {
+    "chat_history": (
+        "chat_id",
+        "session_id",
+        "email",
+        "question",
+        "generated_sql",
+        "state",
+        "latency_ms",
+        "prompt_tokens",
+        "completion_tokens",
+        "cache_hit",
+    ),
+    "login_session": ("session_id", "email"),
+    "user_feedback": ("chat_id", "feedback"),
+}
+
+
+@dataclass
+class AuditRow:
+    table: str
+    values: tuple
+
+
+@dataclass
+class AuditStats:
+    enqueued: int = 0
+    written: int = 0
+    dropped: int = 0
+    failed: int = 0
+    batches: int = 0
+    flush_errors: int = 0
+    last_error: str | None = None
+
+
+class AuditLogger:
+    """Write-behind logger for audit rows. Rows go into a bounded queue and a
+    background thread inserts them in batches, one execute_values per table, when
+    the batch is full or the flush interval has passed.
+
+    When the queue is full, log() waits briefly and then drops the row, so a slow
+    database never holds up a request.
+    """
+
+    def __init__(
+        self,
+        config: AuditLogSettings,
+        get_connection: Callable[[], AbstractContextManager],
+    ):
+        self.config = config
+        self.get_connection = get_connection
+        self.stats = AuditStats()
+        self._queue: queue.Queue[AuditRow] = queue.Queue(maxsize=config.max_queue_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, table: str, data: dict[str, Any]) -> bool:
+        row = AuditRow(table=table, values=tuple(data[i] for i in audit_tables[table]))
+        try:
+            self._queue.put(row, timeout=self.config.enqueue_timeout_seconds)
+        except queue.Full:
+            with self._lock:
+                self.stats.dropped += 1
+                dropped = self.stats.dropped
+            # Log the first drop and then every hundredth to keep the log readable
+            if dropped % 100 == 1:
+                logger.warning(f"Audit queue full, {dropped} rows dropped so far")
+            return False
+
+        with self._lock:
+            self.stats.enqueued += 1
+        return True
+
+    def close(self) -> None:
+        """Stop the flush thread after writing out everything still queued."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.config.shutdown_timeout_seconds)
+        if self._thread.is_alive():
+            logger.warning(
+                f"Audit logger did not finish flushing, {self._queue.qsize()} rows left"
+            )
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_size": self._queue.qsize(),
+                "enqueued": self.stats.enqueued,
+                "written": self.stats.written,
+                "dropped": self.stats.dropped,
+                "failed": self.stats.failed,
+                "batches": self.stats.batches,
+                "flush_errors": self.stats.flush_errors,
+                "last_error": self.stats.last_error,
+            }
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _next_batch(self) -> list[AuditRow]:
+        batch = []
+        deadline = time.monotonic() + self.config.flush_interval_seconds
+        while len(batch) < self.config.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or (self._stop.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[AuditRow]) -> None:
+        for attempt in range(1, self.config.max_retries + 1):
+            try:
+                self._insert(batch)
+            except Exception as e:
+                self._record_error(e)
+                if isinstance(e, psycopg2.Error) and not isinstance(e, transient_errors):
+                    # Data or integrity errors come from the rows themselves, so split
+                    # the batch to keep the good rows and drop only the bad ones
+                    self._split(batch, e)
+                    return
+
+                # The database, connection or pool is the problem, so the same rows
+                # may succeed on a later attempt
+                logger.warning(
+                    f"Audit flush of {len(batch)} rows failed (attempt {attempt}): {e}"
+                )
+                if attempt < self.config.max_retries and not self._stop.is_set():
+                    time.sleep(self.config.retry_backoff_seconds * attempt)
+                continue
+
+            with self._lock:
+                self.stats.written += len(batch)
+                self.stats.batches += 1
+            return
+
+        with self._lock:
+            self.stats.failed += len(batch)
+        logger.error(f"Giving up on {len(batch)} audit rows")
+
+    def _split(self, batch: list[AuditRow], error: Exception) -> None:
+        if len(batch) == 1:
+            with self._lock:
+                self.stats.failed += 1
+            logger.error(f"Dropping audit row for {batch[0].table}: {error}")
+            return
+        middle = len(batch) // 2
+        self._flush(batch[:middle])
+        self._flush(batch[middle:])
+
+    def _insert(self, batch: list[AuditRow]) -> None:
+        tables = defaultdict(list)
+        for row in batch:
+            tables[row.table].append(row.values)
+
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                for table, rows in tables.items():
+                    columns = ", ".join(audit_tables[table])
+                    execute_values(
+                        cursor,
+                        f"INSERT INTO {table} ({columns}) VALUES %s",
+                        rows,
+                        page_size=self.config.batch_size,
+                    )
+            conn.commit()
+
+    def _record_error(self, error: Exception) -> None:
+        with self._lock:
+            self.stats.flush_errors += 1
+            self.stats.last_error = str(error)
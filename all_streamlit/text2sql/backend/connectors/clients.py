@@ -1,7 +1,14 @@
 import boto3
 from functools import lru_cache
-from openai import AzureOpenAI
-from opensearchpy import AWSV4SignerAuth, OpenSearch, RequestsHttpConnection
+from openai import AsyncAzureOpenAI, AzureOpenAI
+from opensearchpy import (
+    AsyncHttpConnection,
+    AsyncOpenSearch,
+    AWSV4SignerAsyncAuth,
+    AWSV4SignerAuth,
+    OpenSearch,
+    RequestsHttpConnection,
+)
 import snowflake.connector
 from text2sql.backend.config import settings
 
@@ -26,6 +33,49 @@ def get_openai_embedding_client():
     )
 
 
+@lru_cache
+def get_openai_router_client():
+    # A cheaper deployment for yes/no routing; defaults to the chat deployment
+    return AzureOpenAI(
+        azure_endpoint=settings.azure_openai.endpoint,
+        api_key=settings.azure_openai.api_key.get_secret_value(),
+        azure_deployment=settings.azure_openai.deployment_router
+        or settings.azure_openai.deployment_chat,
+        api_version=settings.azure_openai.api_version,
+    )
+
+
+@lru_cache
+def get_async_openai_chat_client():
+    return AsyncAzureOpenAI(
+        azure_endpoint=settings.azure_openai.endpoint,
+        api_key=settings.azure_openai.api_key.get_secret_value(),
+        azure_deployment=settings.azure_openai.deployment_chat,
+        api_version=settings.azure_openai.api_version,
+    )
+
+
+@lru_cache
+def get_async_openai_embedding_client():
+    return AsyncAzureOpenAI(
+        azure_endpoint=settings.azure_openai.endpoint,
+        api_key=settings.azure_openai.api_key.get_secret_value(),
+        azure_deployment=settings.azure_openai.deployment_embedding,
+        api_version=settings.azure_openai.api_version,
+    )
+
+
+@lru_cache
+def get_async_openai_router_client():
+    return AsyncAzureOpenAI(
+        azure_endpoint=settings.azure_openai.endpoint,
+        api_key=settings.azure_openai.api_key.get_secret_value(),
+        azure_deployment=settings.azure_openai.deployment_router
+        or settings.azure_openai.deployment_chat,
+        api_version=settings.azure_openai.api_version,
+    )
+
+
 @lru_cache
 def get_opensearch_client():
     if settings.env == "local":
@@ -62,6 +112,41 @@ def get_opensearch_client():
 
 
 @lru_cache
+def get_async_opensearch_client():
+    if settings.env == "local":
+        return AsyncOpenSearch(
+            hosts=[
+                {"host": settings.opensearch.host, "port": settings.opensearch.port}
+            ],
+            http_auth=(
+                settings.opensearch.user,
+                settings.opensearch.password.get_secret_value(),
+            ),
+            http_compress=True,
+            use_ssl=True,
+            verify_certs=False,
+            ssl_assert_hostname=False,
+            ssl_show_warn=False,
+            connection_class=AsyncHttpConnection,
+        )
+
+    else:
+        boto3_session = boto3.Session()
+        region = boto3_session.region_name
+        credentials = boto3_session.get_credentials()
+        auth = AWSV4SignerAsyncAuth(credentials, region, "es")
+
+        return AsyncOpenSearch(
+            hosts=[{"host": settings.opensearch.host, "port": 443}],
+            http_auth=auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=AsyncHttpConnection,
+            pool_maxsize=20,
+            timeout=60,
+        )
+
+
 def get_snowflake_connection(username: str, access_token: str):
     if settings.env == "local":
         account = "gxs-dev"
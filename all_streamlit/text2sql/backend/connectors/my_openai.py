@@ -1,5 +1,11 @@
-from typing import Iterable, Optional
-from openai import OpenAI
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Generator, Iterable, Optional
+from openai import AsyncOpenAI, OpenAI
 from openai.types.chat.chat_completion_assistant_message_param import (
     ChatCompletionAssistantMessageParam,
 )
@@ -17,7 +23,63 @@ from openai.types.chat.chat_completion_user_message_param import (
     ChatCompletionUserMessageParam,
 )
 
-from text2sql.backend.connectors.clients import get_openai_chat_client
+from text2sql.backend.connectors.clients import (
+    get_async_openai_chat_client,
+    get_openai_chat_client,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptUsage:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    # Background reads of streams whose usage hasn't arrived yet
+    pending: list[Future] = field(default_factory=list, repr=False)
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+prompt_usage = PromptUsage()
+_prompt_usage_lock = threading.Lock()
+
+# Usage of the question being answered, if any. Work handed to other threads with a
+# copy of the context adds to the same totals
+request_usage: ContextVar[PromptUsage | None] = ContextVar("request_usage", default=None)
+
+# Reads the rest of streams their callers stopped early, off the request path
+stream_drain_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-stream-drain")
+
+
+def record_usage(usage) -> None:
+    if usage is None:
+        return
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (details.cached_tokens or 0) if details is not None else 0
+
+    with _prompt_usage_lock:
+        prompt_usage.requests += 1
+        prompt_usage.prompt_tokens += usage.prompt_tokens
+        prompt_usage.cached_tokens += cached_tokens
+        prompt_usage.completion_tokens += usage.completion_tokens
+        current = request_usage.get()
+        if current is not None:
+            current.requests += 1
+            current.prompt_tokens += usage.prompt_tokens
+            current.cached_tokens += cached_tokens
+            current.completion_tokens += usage.completion_tokens
+
+    logger.info(
+        f"LLM Usage: prompt={usage.prompt_tokens} cached={cached_tokens} "
+        f"completion={usage.completion_tokens} "
+        f"cumulative_cached_ratio={prompt_usage.cached_ratio:.2f}"
+    )
 
 
 def system_message(
@@ -70,7 +132,91 @@ def submit_prompt(
         temperature=temperature,
     )
 
-    tokens = response.usage.total_tokens
+    record_usage(response.usage)
 
     # If no response with text is found, return the first response's content (which may be empty)
     return response.choices[0].message.content
+
+
+def submit_prompt_stream(
+    prompt: Iterable[ChatCompletionMessageParam],
+    client: OpenAI = get_openai_chat_client(),
+    model: str = "gpt-4o-2024-10-21",
+    temperature: float = 0.7,
+) -> Generator[str, None, None]:
+    if prompt is None:
+        raise Exception("Prompt is None")
+
+    if len(prompt) == 0:
+        raise Exception("Prompt is empty")
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=prompt,
+        stop=None,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    finished = False
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        finished = True
+    finally:
+        if finished:
+            stream.close()
+        else:
+            # Usage only arrives in the last chunk, so a caller that stops early hands
+            # the rest of the stream to a background read, in its context so the usage
+            # still counts towards its question
+            future = stream_drain_executor.submit(
+                contextvars.copy_context().run, _drain_stream, stream
+            )
+            current = request_usage.get()
+            if current is not None:
+                current.pending.append(future)
+
+
+def wait_for_usage(usage: PromptUsage, timeout: float) -> None:
+    """Wait for streams that were stopped early to report their usage."""
+    if usage.pending:
+        wait(usage.pending, timeout=timeout)
+
+
+def _drain_stream(stream) -> None:
+    try:
+        with stream:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    record_usage(chunk.usage)
+    except Exception as e:
+        logger.warning(f"Failed to read the usage of an LLM stream: {e}")
+
+
+async def asubmit_prompt(
+    prompt: Iterable[ChatCompletionMessageParam],
+    client: AsyncOpenAI | None = None,
+    model: str = "gpt-4o-2024-10-21",
+    temperature: float = 0.7,
+) -> str | None:
+    if prompt is None:
+        raise Exception("Prompt is None")
+
+    if len(prompt) == 0:
+        raise Exception("Prompt is empty")
+
+    client = client or get_async_openai_chat_client()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=prompt,
+        stop=None,
+        temperature=temperature,
+    )
+
+    record_usage(response.usage)
+
+    return response.choices[0].message.content
@@ -1,21 +1,212 @@
-from text2sql.backend.connectors.clients import get_snowflake_connection
+from text2sql.backend.config import settings
+from text2sql.backend.connectors.snowflake_pool import get_snowflake_pool
+import asyncio
+import logging
+import threading
+import time
 import pandas as pd
+import pyarrow as pa
 import snowflake.connector
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from snowflake.connector import SnowflakeConnection
+from typing import Generator, Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+# The Snowflake connector is blocking, so async callers run it on a bounded pool
+snowflake_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="snowflake")
+
+
+@dataclass
+class QueryProgress:
+    query_id: Optional[str]
+    state: Literal["running", "fetching", "complete", "cancelled", "timed_out"]
+    elapsed_seconds: float = 0.0
+    rows_produced: int = 0
+
+
+class QueryRegistry:
+    """In-flight Snowflake queries per Streamlit session, so that a session which has
+    moved on to another question can cancel the queries it left behind."""
+
+    def __init__(self):
+        self._queries: dict[str, dict[str, SnowflakeConnection]] = {}
+        self._cancelled: set[str] = set()
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, query_id: str, conn: SnowflakeConnection) -> None:
+        with self._lock:
+            self._queries.setdefault(session_id, {})[query_id] = conn
+
+    def remove(self, session_id: str, query_id: str) -> None:
+        with self._lock:
+            self._queries.get(session_id, {}).pop(query_id, None)
+            self._cancelled.discard(query_id)
+
+    def is_cancelled(self, query_id: str) -> bool:
+        with self._lock:
+            return query_id in self._cancelled
+
+    def cancel_session(self, session_id: str) -> int:
+        with self._lock:
+            queries = self._queries.pop(session_id, {})
+            self._cancelled.update(queries)
+        for query_id, conn in queries.items():
+            cancel_query(conn, query_id)
+        return len(queries)
+
+
+query_registry = QueryRegistry()
+
+
+def cancel_query(conn: SnowflakeConnection, query_id: str) -> None:
+    try:
+        conn.cursor().execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+        logger.info(f"Cancelled Snowflake query {query_id}")
+    except snowflake.connector.errors.Error as e:
+        logger.warning(f"Failed to cancel Snowflake query {query_id}: {e}")
+
+
+def get_current_role(username: str, access_token: str) -> str:
+    with get_snowflake_pool().connection(username, access_token) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT CURRENT_ROLE()")
+        return cur.fetchone()[0]
+
 
-@lru_cache
 def execute_sql(sql: str, username:str, access_token:str) -> pd.DataFrame | None:
-    conn = get_snowflake_connection(username, access_token)
-    cs = conn.cursor()
-    
+    for progress, df in stream_sql(sql, username, access_token):
+        if progress.state == "complete":
+            return df
+    return None
+
+
+def stream_sql(
+    sql: str,
+    username: str,
+    access_token: str,
+    session_id: Optional[str] = None,
+    timeout_seconds: Optional[float] = None,
+) -> Generator[tuple[QueryProgress, pd.DataFrame | None], None, None]:
+    """Submit the SQL with execute_async and poll it by query id.
+
+    Yields (progress, None) while the query runs, (progress, preview) from the first
+    Arrow batch when more batches follow, then (progress, df) once complete. Yields
+    nothing if the SQL is invalid. A query still running when the generator is closed
+    early, times out or is cancelled through query_registry is cancelled in Snowflake.
+    """
+    config = settings.snowflake
+    timeout_seconds = timeout_seconds or config.query_timeout_seconds
+
+    with get_snowflake_pool().connection(username, access_token) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute_async(sql)
+        except snowflake.connector.errors.ProgrammingError:
+            return
+
+        query_id = cur.sfqid
+        start = time.monotonic()
+        if session_id is not None:
+            query_registry.add(session_id, query_id, conn)
+
+        finished = False
+        try:
+            poll_interval = config.query_poll_interval_seconds
+            while True:
+                try:
+                    status = conn.get_query_status_throw_if_error(query_id)
+                except snowflake.connector.errors.ProgrammingError:
+                    finished = True
+                    if query_registry.is_cancelled(query_id):
+                        yield QueryProgress(
+                            query_id, "cancelled", time.monotonic() - start
+                        ), None
+                    return
+
+                elapsed = time.monotonic() - start
+                if not conn.is_still_running(status):
+                    break
+                if elapsed > timeout_seconds:
+                    logger.warning(
+                        f"Snowflake query {query_id} timed out after {elapsed:.0f}s"
+                    )
+                    cancel_query(conn, query_id)
+                    finished = True
+                    yield QueryProgress(query_id, "timed_out", elapsed), None
+                    return
+
+                yield QueryProgress(query_id, "running", elapsed), None
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 1.5, config.query_max_poll_interval_seconds)
+
+            # The query has finished on the warehouse, so closing early costs nothing
+            finished = True
+            cur.get_results_from_sfqid(query_id)
+            for df, is_complete in iter_cursor_dataframes(cur):
+                yield QueryProgress(
+                    query_id,
+                    "complete" if is_complete else "fetching",
+                    time.monotonic() - start,
+                    len(df),
+                ), df
+        finally:
+            if session_id is not None:
+                query_registry.remove(session_id, query_id)
+            if not finished:
+                cancel_query(conn, query_id)
+
+
+def iter_cursor_dataframes(
+    cur, preview: bool = True
+) -> Generator[tuple[pd.DataFrame, bool], None, None]:
+    columns = [desc[0] for desc in cur.description]
+
     try:
-        cur = cs.execute(sql)
+        tables = []
+        for table in cur.fetch_arrow_batches():
+            if preview and len(tables) == 1:
+                yield tables[0].to_pandas(), False
+            tables.append(table)
+    except snowflake.connector.errors.NotSupportedError:
+        # Results that don't come back in Arrow format, e.g. SHOW or DESCRIBE
+        yield pd.DataFrame(cur.fetchall(), columns=columns), True
+        return
+
+    if not tables:
+        yield pd.DataFrame(columns=columns), True
+    else:
+        # Concatenation keeps the batches as chunks instead of copying them, and
+        # split_blocks avoids consolidating columns into one large block
+        yield pa.concat_tables(tables).to_pandas(split_blocks=True), True
 
-        results = cur.fetchall()
 
-        # Create a pandas dataframe from the results
-        df = pd.DataFrame(results, columns=[desc[0] for desc in cur.description])
+def fetch_all_dataframe(cur) -> pd.DataFrame:
+    """The full result of the cursor, without the early preview."""
+    for df, _ in iter_cursor_dataframes(cur, preview=False):
         return df
 
-    except snowflake.connector.errors.ProgrammingError:
-        return None
\ No newline at end of file
+
+async def aget_current_role(username: str, access_token: str) -> str:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            snowflake_executor,
+            partial(get_current_role, username=username, access_token=access_token),
+        )
+    except snowflake.connector.errors.Error as e:
+        # Scoping to the user is never wider than their role
+        logger.warning(f"Failed to resolve the Snowflake role of {username}: {e}")
+        return username
+
+
+async def aexecute_sql(
+    sql: str, username: str, access_token: str
+) -> pd.DataFrame | None:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        snowflake_executor,
+        partial(execute_sql, sql=sql, username=username, access_token=access_token),
+    )
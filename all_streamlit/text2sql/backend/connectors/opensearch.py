@@ -1,60 +1,182 @@
 import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import asdict
-from hashlib import blake2b
 from pathlib import Path
+from typing import Generator, Iterable
 
-from opensearchpy import OpenSearch
+from opensearchpy import OpenSearch, TransportError
+from opensearchpy.helpers import scan
 
+from text2sql.backend.config import settings
 from text2sql.backend.data_prep import (
     DDL,
     Doc,
     QuestionSQL,
-    get_ddl,
+    embed_documents,
+    get_document_id,
     get_finance_context,
-    get_verified_questions,
+    parse_ddl,
+    parse_verified_questions,
 )
 
 logger = logging.getLogger(__name__)
 training_data_folder = f"{Path(__file__).parents[3]}/training_data"
 
+index_targets = {i.opensearch_index_name: i for i in [Doc, DDL, QuestionSQL]}
+# Recorded in each index's mapping _meta once its document ids are content ids
+id_scheme = "content"
 
-def index_dococument(client: OpenSearch, index_name: str, doc_list: list[dict]):
-    body_list = []
 
-    for doc in doc_list:
-        id = blake2b(str(doc).encode("utf-8")).hexdigest()
+def index_dococument(
+    client: OpenSearch, index_name: str, doc_list: Iterable[dict]
+) -> dict:
+    config = settings.opensearch
+    success_count = 0
+    failures = []
+    refresh_disabled = False
+    refresh_interval = None
+    in_flight = set()
 
-        action = {"index": {"_index": index_name, "_id": id}}
-        body_list.append(action)
-        body_list.append(doc)
+    def collect(done):
+        nonlocal success_count
+        for future in done:
+            n_success, chunk_failures = future.result()
+            success_count += n_success
+            failures.extend(chunk_failures)
 
-    response = client.bulk(body=body_list)
+    try:
+        with ThreadPoolExecutor(max_workers=config.bulk_max_concurrency) as executor:
+            for n_chunk, chunk in enumerate(
+                _chunk_bulk_actions(client, index_name, doc_list, config.bulk_max_bytes)
+            ):
+                if n_chunk == 1:
+                    # More than one bulk request means a large load, so stop refreshing
+                    # the index after every request until it's done
+                    refresh_interval = _disable_refresh(client, index_name)
+                    refresh_disabled = True
 
-    success_count = 0
-    failure_count = 0
-    failures = []
+                if len(in_flight) >= config.bulk_max_concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(executor.submit(_send_bulk_chunk, client, chunk))
 
-    for i, item_res in enumerate(response["items"]):
-        if item_res["index"]["status"] < 300:
-            success_count += 1
-        else:
-            failure_count += 1
-            failures.append({"error_item": body_list[2 * i + 1], "reason": item_res})
+            collect(in_flight)
+    finally:
+        if refresh_disabled:
+            _restore_refresh(client, index_name, refresh_interval)
 
     summary = {
-        "total": len(doc_list),
+        "total": success_count + len(failures),
         "successful": success_count,
-        "failed": failure_count,
+        "failed": len(failures),
     }
 
     logger.info(f"Opensearch Indexing Summary: {str(summary)}")
 
-    if failure_count != 0:
+    if failures:
         logger.error(f"Opensearch Indexing Error: {str(failures)}")
 
     return summary
 
 
+def _chunk_bulk_actions(
+    client: OpenSearch, index_name: str, doc_list: Iterable[dict], max_bytes: int
+) -> Generator[list[tuple[dict, str]], None, None]:
+    chunk = []
+    chunk_bytes = 0
+
+    for doc in doc_list:
+        id = get_document_id(doc)
+        action = {"index": {"_index": index_name, "_id": id}}
+        lines = (
+            client.transport.serializer.dumps(action)
+            + "\n"
+            + client.transport.serializer.dumps(doc)
+            + "\n"
+        )
+        size = len(lines.encode("utf-8"))
+
+        if chunk and chunk_bytes + size > max_bytes:
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((doc, lines))
+        chunk_bytes += size
+
+    if chunk:
+        yield chunk
+
+
+def _send_bulk_chunk(
+    client: OpenSearch, chunk: list[tuple[dict, str]]
+) -> tuple[int, list[dict]]:
+    max_retries = settings.opensearch.bulk_max_retries
+    success_count = 0
+    failures = []
+    pending = chunk
+
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            time.sleep(min(2**attempt, 30) + random.random())
+
+        try:
+            response = client.bulk(body="".join(lines for _, lines in pending))
+        except TransportError as e:
+            if attempt == max_retries or not _is_retryable(getattr(e, "status_code", None)):
+                failures.extend({"error_item": doc, "reason": str(e)} for doc, _ in pending)
+                return success_count, failures
+            logger.warning(f"Opensearch bulk request failed, retrying: {e}")
+            continue
+
+        retry = []
+        for item, item_res in zip(pending, response["items"]):
+            status = item_res["index"]["status"]
+            if status < 300:
+                success_count += 1
+            elif _is_retryable(status) and attempt < max_retries:
+                retry.append(item)
+            else:
+                failures.append({"error_item": item[0], "reason": item_res})
+
+        if not retry:
+            break
+        logger.warning(f"Opensearch bulk retrying {len(retry)} failed items")
+        pending = retry
+
+    return success_count, failures
+
+
+def _is_retryable(status: int | str | None) -> bool:
+    # 429 means the bulk queue is full; "N/A" is opensearch-py's status for connection errors
+    return status in (429, "N/A") or (isinstance(status, int) and status >= 500)
+
+
+def _disable_refresh(client: OpenSearch, index_name: str) -> str | None:
+    response = client.indices.get_settings(
+        index=index_name, name="index.refresh_interval"
+    )
+    refresh_interval = (
+        response.get(index_name, {})
+        .get("settings", {})
+        .get("index", {})
+        .get("refresh_interval")
+    )
+    client.indices.put_settings(
+        index=index_name, body={"index": {"refresh_interval": "-1"}}
+    )
+    return refresh_interval
+
+
+def _restore_refresh(client: OpenSearch, index_name: str, refresh_interval: str | None):
+    # None resets the setting to the cluster default
+    client.indices.put_settings(
+        index=index_name, body={"index": {"refresh_interval": refresh_interval}}
+    )
+    client.indices.refresh(index=index_name)
+
+
 def create_index(client: OpenSearch, index_name: str, index_target):
     index_body = {
         "settings": {
@@ -63,6 +185,7 @@ def create_index(client: OpenSearch, index_name: str, index_target):
             "index": {"knn": True},
         },
         "mappings": {
+            "_meta": {"id_scheme": id_scheme},
             "properties": {
                 i: j.metadata["opensearch_properties"]
                 for i, j in index_target.__dataclass_fields__.items()
@@ -73,7 +196,138 @@ def create_index(client: OpenSearch, index_name: str, index_target):
     return response
 
 
-def init_indices(client: OpenSearch):
+def sync_documents(
+    client: OpenSearch, index_name: str, documents: list, delete_missing: bool = False
+) -> dict:
+    """Embed and index only documents whose content id isn't in the index yet."""
+    migrated = migrate_legacy_ids(client, index_name)
+    documents = list({get_document_id(vars(i)): i for i in documents}.items())
+    existing_ids = get_existing_ids(client, index_name, [id for id, _ in documents])
+    new_documents = [i for id, i in documents if id not in existing_ids]
+
+    logger.info(
+        f"Opensearch Sync {index_name}: {len(new_documents)} new, {len(existing_ids)} unchanged"
+    )
+    summary = index_dococument(
+        client, index_name, (asdict(i) for i in embed_documents(new_documents))
+    )
+    summary["unchanged"] = len(existing_ids)
+    summary["migrated"] = migrated
+
+    if delete_missing:
+        source_ids = {id for id, _ in documents}
+        stale_ids = [
+            hit["_id"]
+            for hit in scan(
+                client, index=index_name, query={"_source": False}, size=1000
+            )
+            if hit["_id"] not in source_ids
+        ]
+        summary["deleted"] = delete_documents(client, index_name, stale_ids)
+
+    return summary
+
+
+def migrate_legacy_ids(client: OpenSearch, index_name: str) -> int:
+    """Re-key documents indexed before ids were derived from content, once per index.
+
+    Their ids were hashed from the whole document, so they never match a content id and
+    would sit next to the re-indexed copy as duplicates. Each one is indexed again under
+    its content id, reusing the stored embeddings, and the old id is deleted. The index
+    mapping's _meta records that the index uses content ids, so later syncs skip this.
+    """
+    mapping = client.indices.get_mapping(index=index_name)
+    if mapping[index_name]["mappings"].get("_meta", {}).get("id_scheme") == id_scheme:
+        return 0
+
+    # The text fields are all the content id is derived from
+    text_fields = get_text_fields(index_targets[index_name])
+    legacy_ids = {}
+    for hit in scan(
+        client,
+        index=index_name,
+        query={"query": {"match_all": {}}, "_source": text_fields},
+        size=1000,
+    ):
+        id = get_document_id(hit["_source"])
+        if hit["_id"] != id:
+            legacy_ids[hit["_id"]] = id
+
+    migrated = 0
+    if legacy_ids:
+        logger.info(
+            f"Opensearch Migrating {len(legacy_ids)} documents in {index_name} to content ids"
+        )
+        existing_ids = get_existing_ids(client, index_name, list(set(legacy_ids.values())))
+        # One legacy copy per content id is enough, and only those are fetched in full
+        to_reindex = {}
+        for old_id, id in legacy_ids.items():
+            if id not in existing_ids:
+                to_reindex.setdefault(id, old_id)
+
+        summary = index_dococument(
+            client, index_name, get_documents(client, index_name, list(to_reindex.values()))
+        )
+        if summary["failed"]:
+            # Keep the old ids and leave the index unmarked; the next sync tries again
+            logger.warning(f"Opensearch Migration of {index_name} incomplete, kept legacy ids")
+            return 0
+        migrated = delete_documents(client, index_name, list(legacy_ids))
+
+    client.indices.put_mapping(index=index_name, body={"_meta": {"id_scheme": id_scheme}})
+    return migrated
+
+
+def get_documents(
+    client: OpenSearch, index_name: str, ids: list[str], chunk_size: int = 500
+) -> Generator[dict, None, None]:
+    for i in range(0, len(ids), chunk_size):
+        response = client.mget(index=index_name, body={"ids": ids[i : i + chunk_size]})
+        for doc in response["docs"]:
+            if doc.get("found"):
+                yield doc["_source"]
+
+
+def get_text_fields(index_target) -> list[str]:
+    return [
+        i
+        for i, j in index_target.__dataclass_fields__.items()
+        if j.metadata["opensearch_properties"]["type"] == "text"
+    ]
+
+
+def get_existing_ids(
+    client: OpenSearch, index_name: str, ids: list[str], chunk_size: int = 1000
+) -> set[str]:
+    existing_ids = set()
+    for i in range(0, len(ids), chunk_size):
+        response = client.mget(
+            index=index_name, body={"ids": ids[i : i + chunk_size]}, _source=False
+        )
+        existing_ids.update(doc["_id"] for doc in response["docs"] if doc.get("found"))
+    return existing_ids
+
+
+def delete_documents(
+    client: OpenSearch, index_name: str, ids: list[str], chunk_size: int = 1000
+) -> int:
+    deleted_count = 0
+    for i in range(0, len(ids), chunk_size):
+        body = [
+            {"delete": {"_index": index_name, "_id": id}}
+            for id in ids[i : i + chunk_size]
+        ]
+        response = client.bulk(body=body)
+        deleted_count += sum(
+            1 for item in response["items"] if item["delete"]["status"] < 300
+        )
+
+    if ids:
+        logger.info(f"Opensearch Deleted {deleted_count} stale documents from {index_name}")
+    return deleted_count
+
+
+def init_indices(client: OpenSearch, delete_missing: bool = False):
     for index in [Doc, DDL, QuestionSQL]:
         index_name = index.opensearch_index_name
         if not client.indices.exists(index=index_name):
@@ -83,24 +337,22 @@ def init_indices(client: OpenSearch):
                 index_target=index,
             )
             logger.info(f"New Index Created: {index_name}")
-
-            match index_name:
-                case "ddl":
-                    with open(f"{training_data_folder}/sql_tables.txt") as f:
-                        ddl = f.read()
-                        data = get_ddl(ddl)
-                case "question_sql":
-                    with open(f"{training_data_folder}/examples.txt") as f:
-                        questions = f.read()
-                        data = get_verified_questions(questions)
-                case "doc":
-                    data = get_finance_context()
-
-            data_list_dict = [asdict(i) for i in data]
-            index_dococument(client, index_name, data_list_dict)
-
-            logger.info(f"Initiate Index Data: {index_name}")
         else:
             logger.info(f"Index Exists: {index_name}")
 
+        match index_name:
+            case "ddl":
+                with open(f"{training_data_folder}/sql_tables.txt") as f:
+                    ddl = f.read()
+                    data = parse_ddl(ddl)
+            case "question_sql":
+                with open(f"{training_data_folder}/examples.txt") as f:
+                    questions = f.read()
+                    data = parse_verified_questions(questions)
+            case "doc":
+                data = get_finance_context()
+
+        sync_documents(client, index_name, data, delete_missing=delete_missing)
+        logger.info(f"Index Data Synced: {index_name}")
+
         logger.info(client.indices.get_mapping(index_name))
@@ -1,24 +1,30 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from functools import partial
 
+import psycopg2
 import streamlit as st
 from psycopg2 import OperationalError
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.extensions import connection
 from pydantic import SecretStr
 from streamlit.logger import get_logger
 
 from text2sql.backend.aws_utils import get_secretsmanager_password
 from text2sql.backend.config import settings
+from text2sql.backend.connectors.audit_logger import AuditLogger
+from text2sql.backend.connectors.postgres_pool import PostgresConnectionPool
 
 logger = get_logger(__name__)
 
+postgres_executor = ThreadPoolExecutor(
+    max_workers=settings.postgres.pool_max_connections, thread_name_prefix="postgres"
+)
 
-@st.cache_resource
-def init_connection_pool():
-    partial_pool = partial(
-        SimpleConnectionPool,
-        minconn=1,
-        maxconn=10,
+
+def connect() -> connection:
+    partial_connect = partial(
+        psycopg2.connect,
         dbname=settings.postgres.db,
         user=settings.postgres.user,
         host=settings.postgres.host,
@@ -26,9 +32,7 @@ def init_connection_pool():
     )
 
     try:
-        pool = partial_pool(password=settings.postgres.password.get_secret_value())
-        logger.info("DB connection pool created successfully")
-        return pool
+        return partial_connect(password=settings.postgres.password.get_secret_value())
     except OperationalError as e:
         if "password authentication failed" in str(e).lower():
             logger.warn(
@@ -38,21 +42,44 @@ def init_connection_pool():
                 settings.postgres.aws_secretsmanager_secret_id
             )
             settings.postgres.password = SecretStr(password)
-            pool = partial_pool(password=settings.postgres.password.get_secret_value())
-            return pool
+            return partial_connect(password=settings.postgres.password.get_secret_value())
         else:
             raise
 
 
+@st.cache_resource
+def init_connection_pool() -> PostgresConnectionPool:
+    pool = PostgresConnectionPool(config=settings.postgres, connect=connect)
+    logger.info("DB connection pool created successfully")
+    return pool
+
+
 @contextmanager
 def get_db_connection():
-    pool = init_connection_pool()
-    conn = pool.getconn()
-    try:
+    """A pooled connection; the transaction is committed if the block succeeds and
+    rolled back if it raises."""
+    with init_connection_pool().connection() as conn:
         yield conn
-    finally:
-        conn.commit()
-        pool.putconn(conn)
+
+
+def run_query(query, data=None, fetch: bool = False) -> list[tuple] | None:
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, data)
+            return cursor.fetchall() if fetch else None
+
+
+async def arun_query(query, data=None, fetch: bool = False) -> list[tuple] | None:
+    # psycopg2 blocks, so queries run on a thread per pooled connection
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        postgres_executor, partial(run_query, query, data, fetch)
+    )
+
+
+@st.cache_resource
+def get_audit_logger() -> AuditLogger:
+    return AuditLogger(config=settings.audit_log, get_connection=get_db_connection)
 
 
 def run_dml(query, data):
@@ -62,19 +89,35 @@ def run_dml(query, data):
                 cursor.execute(query, data)
                 conn.commit()
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"DML failed: {e}")
+
+
+def write_audit_row(table: str, query: str, data: dict) -> None:
+    # Write-behind unless disabled; the synchronous path is kept for debugging
+    if settings.audit_log.enabled:
+        get_audit_logger().log(table, data)
+    else:
+        run_dml(query, data)
 
 
 def insert_chat_history(data):
-    query = """INSERT INTO chat_history (chat_id, session_id, email, question, generated_sql, state) VALUES (%(chat_id)s, %(session_id)s, %(email)s, %(question)s, %(generated_sql)s, %(state)s)"""
-    run_dml(query, data)
+    query = """INSERT INTO chat_history (chat_id, session_id, email, question, generated_sql, state, latency_ms, prompt_tokens, completion_tokens, cache_hit) VALUES (%(chat_id)s, %(session_id)s, %(email)s, %(question)s, %(generated_sql)s, %(state)s, %(latency_ms)s, %(prompt_tokens)s, %(completion_tokens)s, %(cache_hit)s)"""
+    # The analytics columns are optional
+    data = {
+        "latency_ms": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "cache_hit": None,
+        **data,
+    }
+    write_audit_row("chat_history", query, data)
 
 
 def create_session(data):
     query = """INSERT INTO login_session (session_id, email) VALUES (%(session_id)s, %(email)s)"""
-    run_dml(query, data)
+    write_audit_row("login_session", query, data)
 
 
 def insert_feedback(data):
     query = """INSERT INTO user_feedback (chat_id, feedback) VALUES (%(chat_id)s, %(feedback)s)"""
-    run_dml(query, data)
+    write_audit_row("user_feedback", query, data)
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Generator
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+
+from text2sql.backend.config import PostgresSettings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class PooledConnection:
+    conn: connection
+    created_at: float = field(default_factory=time.time)
+    last_used_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waits: int = 0
+    timeouts: int = 0
+    created: int = 0
+    discarded: int = 0
+    recycled: int = 0
+    wait_seconds: float = 0.0
+
+
+class PostgresConnectionPool:
+    """A thread-safe, bounded pool of Postgres connections.
+
+    Callers wait up to pool_checkout_timeout_seconds for a free connection. A connection
+    is validated on checkout, pinged if it has been idle for a while, and replaced once
+    it is older than pool_max_lifetime_seconds. The transaction is committed when the
+    block succeeds and rolled back when it raises, and broken connections are never
+    returned to the pool.
+    """
+
+    def __init__(self, config: PostgresSettings, connect: Callable[[], connection]):
+        self.config = config
+        self.connect = connect
+        self.stats = PoolStats()
+        self._idle: deque[PooledConnection] = deque()
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="postgres-pool-reaper", daemon=True
+        )
+        self._thread.start()
+
+    @contextmanager
+    def connection(self) -> Generator[connection, None, None]:
+        pooled = self._checkout()
+        try:
+            yield pooled.conn
+            if not pooled.conn.closed:
+                pooled.conn.commit()
+        except BaseException:
+            if not pooled.conn.closed:
+                try:
+                    pooled.conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._checkin(pooled)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            _close(pooled)
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "max_size": self.config.pool_max_connections,
+                "checkouts": self.stats.checkouts,
+                "waits": self.stats.waits,
+                "timeouts": self.stats.timeouts,
+                "created": self.stats.created,
+                "discarded": self.stats.discarded,
+                "recycled": self.stats.recycled,
+                "avg_wait_ms": (
+                    self.stats.wait_seconds / self.stats.waits * 1000
+                    if self.stats.waits
+                    else 0.0
+                ),
+            }
+
+    def _checkout(self) -> PooledConnection:
+        deadline = time.monotonic() + self.config.pool_checkout_timeout_seconds
+        start = time.monotonic()
+        waited = False
+
+        while True:
+            with self._cond:
+                # Queue behind existing waiters rather than jumping ahead of them
+                while (not self._idle and self._size >= self.config.pool_max_connections) or (
+                    self._waiting and not waited
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No Postgres connection available within {self.config.pool_checkout_timeout_seconds}s"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    # Most recently used first, so rarely used connections age out
+                    pooled = self._idle.pop()
+                else:
+                    pooled = None
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+
+                # A checkin's notify can land before its waiter runs, while newcomers
+                # queue behind that waiter, so pass the wakeup on while capacity is left
+                if self._waiting and (
+                    self._idle or self._size < self.config.pool_max_connections
+                ):
+                    self._cond.notify()
+
+            if pooled is None:
+                pooled = self._create()
+            elif not self._is_healthy(pooled):
+                self._discard(pooled)
+                continue
+
+            with self._cond:
+                self.stats.checkouts += 1
+                if waited:
+                    self.stats.waits += 1
+                    self.stats.wait_seconds += time.monotonic() - start
+            return pooled
+
+    def _create(self) -> PooledConnection:
+        try:
+            pooled = PooledConnection(conn=self.connect())
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats.created += 1
+        return pooled
+
+    def _checkin(self, pooled: PooledConnection) -> None:
+        conn = pooled.conn
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self._discard(pooled)
+            return
+        if time.time() - pooled.created_at > self.config.pool_max_lifetime_seconds:
+            with self._cond:
+                self.stats.recycled += 1
+            self._discard(pooled)
+            return
+
+        pooled.last_used_at = time.time()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard(self, pooled: PooledConnection) -> None:
+        _close(pooled)
+        with self._cond:
+            self._size -= 1
+            self.stats.discarded += 1
+            self._cond.notify()
+
+    def _is_healthy(self, pooled: PooledConnection) -> bool:
+        if pooled.conn.closed:
+            return False
+        if time.time() - pooled.created_at > self.config.pool_max_lifetime_seconds:
+            with self._cond:
+                self.stats.recycled += 1
+            return False
+        if time.time() - pooled.last_used_at < self.config.pool_health_check_after_seconds:
+            return True
+        try:
+            with pooled.conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            pooled.conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.info(f"Discarding unhealthy Postgres connection: {e}")
+            return False
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.config.pool_reap_interval_seconds)
+            now = time.time()
+            expired = []
+            with self._cond:
+                # Keep pool_min_connections warm, oldest idle connections go first
+                for pooled in list(self._idle):
+                    if self._size - len(expired) <= self.config.pool_min_connections:
+                        break
+                    if (
+                        now - pooled.last_used_at > self.config.pool_idle_timeout_seconds
+                        or now - pooled.created_at > self.config.pool_max_lifetime_seconds
+                    ):
+                        self._idle.remove(pooled)
+                        expired.append(pooled)
+                self._size -= len(expired)
+            for pooled in expired:
+                _close(pooled)
+            if expired:
+                logger.info(f"Closed {len(expired)} idle Postgres connections")
+
+
+def _close(pooled: PooledConnection) -> None:
+    try:
+        pooled.conn.close()
+    except psycopg2.Error as e:
+        logger.warning(f"Failed to close Postgres connection: {e}")
@@ -0,0 +1,309 @@
+import base64
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Generator, Optional
+
+import httpx
+import snowflake.connector
+from snowflake.connector import SnowflakeConnection
+
+from text2sql.backend.config import OAuthSettings, SnowflakeSettings, settings
+from text2sql.backend.connectors.clients import get_snowflake_connection
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class OAuthToken:
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: float
+    last_used_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class PooledConnection:
+    conn: SnowflakeConnection
+    created_at: float = field(default_factory=time.time)
+    last_used_at: float = field(default_factory=time.time)
+
+
+def get_token_expiry(access_token: str, default_lifetime_seconds: int) -> float:
+    # OAuth access tokens from the IdP are JWTs; the exp claim is read without verifying
+    # the signature since Snowflake does that on connect
+    try:
+        payload = access_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + default_lifetime_seconds
+
+
+class TokenManager:
+    """Keeps each user's OAuth access token fresh by refreshing it in a background
+    thread shortly before it expires. Users who haven't used the app for
+    idle_user_ttl_seconds are forgotten, and on_evict callbacks release what else is
+    held for them."""
+
+    def __init__(self, config: OAuthSettings):
+        self.config = config
+        self.on_evict: list[Callable[[str], None]] = []
+        self._tokens: dict[str, OAuthToken] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="snowflake-token-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def register(
+        self, username: str, access_token: str, refresh_token: Optional[str]
+    ) -> None:
+        expires_at = get_token_expiry(
+            access_token, self.config.default_token_lifetime_seconds
+        )
+        with self._lock:
+            token = self._tokens.get(username)
+            # A session may still hold a token the background thread already replaced
+            if token is not None and token.expires_at >= expires_at:
+                if refresh_token and not token.refresh_token:
+                    token.refresh_token = refresh_token
+                token.last_used_at = time.time()
+                return
+            self._tokens[username] = OAuthToken(
+                access_token=access_token,
+                refresh_token=refresh_token or (token and token.refresh_token),
+                expires_at=expires_at,
+            )
+
+    def get_access_token(self, username: str) -> Optional[str]:
+        with self._lock:
+            token = self._tokens.get(username)
+            if token is not None:
+                token.last_used_at = time.time()
+        if token is None:
+            return None
+        if token.expires_at - time.time() < self.config.token_refresh_margin_seconds:
+            # The background refresh hasn't caught up, so refresh inline
+            self.refresh(username)
+            with self._lock:
+                token = self._tokens.get(username)
+        return token.access_token if token is not None else None
+
+    def refresh(self, username: str) -> bool:
+        with self._lock:
+            token = self._tokens.get(username)
+        if token is None or not token.refresh_token:
+            return False
+
+        try:
+            r = httpx.post(
+                url=self.config.token_url,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": token.refresh_token,
+                    "client_id": self.config.client_id,
+                    "client_secret": self.config.client_secret.get_secret_value(),
+                },
+                timeout=10,
+            )
+            r.raise_for_status()
+            payload = r.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Snowflake OAuth token refresh failed for {username}: {e}")
+            return False
+
+        access_token = payload["access_token"]
+        expires_in = payload.get("expires_in")
+        with self._lock:
+            current = self._tokens.get(username)
+            if current is None:
+                # Evicted while the request was in flight
+                return False
+            self._tokens[username] = OAuthToken(
+                access_token=access_token,
+                # Some IdPs rotate refresh tokens on every use
+                refresh_token=payload.get("refresh_token", token.refresh_token),
+                last_used_at=current.last_used_at,
+                expires_at=(
+                    time.time() + float(expires_in)
+                    if expires_in
+                    else get_token_expiry(
+                        access_token, self.config.default_token_lifetime_seconds
+                    )
+                ),
+            )
+        logger.info(f"Snowflake OAuth token refreshed for {username}")
+        return True
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.config.token_refresh_check_interval_seconds)
+            now = time.time()
+            with self._lock:
+                idle = [
+                    username
+                    for username, token in self._tokens.items()
+                    if now - token.last_used_at > self.config.idle_user_ttl_seconds
+                ]
+                for username in idle:
+                    del self._tokens[username]
+                due = [
+                    username
+                    for username, token in self._tokens.items()
+                    if token.refresh_token
+                    and token.expires_at - now < self.config.token_refresh_margin_seconds
+                ]
+            for username in idle:
+                self._evict(username)
+            for username in due:
+                self.refresh(username)
+
+    def _evict(self, username: str) -> None:
+        logger.info(f"Forgetting Snowflake OAuth token of idle user {username}")
+        for callback in self.on_evict:
+            try:
+                callback(username)
+            except Exception as e:
+                logger.warning(f"Failed to release resources of {username}: {e}")
+
+
+class SnowflakeConnectionPool:
+    """A bounded pool of Snowflake connections per user.
+
+    Idle connections are closed after idle_timeout_seconds by a background thread, and
+    connections idle for longer than health_check_after_seconds are pinged before reuse.
+    """
+
+    def __init__(self, config: SnowflakeSettings, token_manager: TokenManager):
+        self.config = config
+        self.token_manager = token_manager
+        self._idle: dict[str, deque[PooledConnection]] = {}
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="snowflake-pool-reaper", daemon=True
+        )
+        self._thread.start()
+
+    @contextmanager
+    def connection(
+        self, username: str, access_token: str
+    ) -> Generator[SnowflakeConnection, None, None]:
+        with self._lock:
+            slots = self._slots.setdefault(
+                username,
+                threading.BoundedSemaphore(self.config.pool_max_connections_per_user),
+            )
+        if not slots.acquire(timeout=self.config.pool_checkout_timeout_seconds):
+            raise PoolTimeoutError(
+                f"No Snowflake connection available for {username} within {self.config.pool_checkout_timeout_seconds}s"
+            )
+
+        pooled = None
+        try:
+            pooled = self._checkout(username, access_token)
+            yield pooled.conn
+        except snowflake.connector.errors.ProgrammingError:
+            # Invalid SQL leaves the session intact
+            raise
+        except snowflake.connector.errors.DatabaseError:
+            # The session may be unusable, so don't hand it to the next query
+            if pooled is not None:
+                _close(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                pooled.last_used_at = time.time()
+                with self._lock:
+                    self._idle.setdefault(username, deque()).append(pooled)
+            slots.release()
+
+    def close_user(self, username: str) -> None:
+        """Close a user's idle connections and drop their per-user state."""
+        with self._lock:
+            idle = list(self._idle.pop(username, ()))
+            # Anyone still holding a slot releases it on the old semaphore
+            self._slots.pop(username, None)
+        for pooled in idle:
+            _close(pooled)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle = [i for connections in self._idle.values() for i in connections]
+            self._idle.clear()
+        for pooled in idle:
+            _close(pooled)
+
+    def _checkout(self, username: str, access_token: str) -> PooledConnection:
+        while True:
+            with self._lock:
+                connections = self._idle.get(username)
+                # Most recently used first, so rarely used connections age out
+                pooled = connections.pop() if connections else None
+            if pooled is None:
+                break
+            if self._is_healthy(pooled):
+                return pooled
+            _close(pooled)
+
+        access_token = self.token_manager.get_access_token(username) or access_token
+        return PooledConnection(conn=get_snowflake_connection(username, access_token))
+
+    def _is_healthy(self, pooled: PooledConnection) -> bool:
+        if pooled.conn.is_closed():
+            return False
+        if time.time() - pooled.last_used_at < self.config.pool_health_check_after_seconds:
+            return True
+        try:
+            pooled.conn.cursor().execute("SELECT 1").fetchone()
+            return True
+        except snowflake.connector.errors.Error as e:
+            logger.info(f"Discarding unhealthy Snowflake connection: {e}")
+            return False
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.config.pool_reap_interval_seconds)
+            now = time.time()
+            expired = []
+            with self._lock:
+                for connections in self._idle.values():
+                    for pooled in list(connections):
+                        if now - pooled.last_used_at > self.config.pool_idle_timeout_seconds:
+                            connections.remove(pooled)
+                            expired.append(pooled)
+            for pooled in expired:
+                _close(pooled)
+            if expired:
+                logger.info(f"Closed {len(expired)} idle Snowflake connections")
+
+
+def _close(pooled: PooledConnection) -> None:
+    try:
+        pooled.conn.close()
+    except snowflake.connector.errors.Error as e:
+        logger.warning(f"Failed to close Snowflake connection: {e}")
+
+
+@lru_cache
+def get_token_manager() -> TokenManager:
+    return TokenManager(config=settings.oauth)
+
+
+@lru_cache
+def get_snowflake_pool() -> SnowflakeConnectionPool:
+    token_manager = get_token_manager()
+    pool = SnowflakeConnectionPool(config=settings.snowflake, token_manager=token_manager)
+    token_manager.on_evict.append(pool.close_user)
+    return pool
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Optional
+
+from openai import AsyncOpenAI
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from text2sql.backend.config import settings
+from text2sql.backend.connectors.clients import get_async_openai_router_client
+from text2sql.backend.connectors.my_openai import (
+    PromptUsage,
+    asubmit_prompt,
+    request_usage,
+)
+from text2sql.backend.connectors.my_snowflake import aget_current_role
+from text2sql.backend.core.chart_handler import agenerate_chart
+from text2sql.backend.core.intent_router import get_intent_router
+from text2sql.backend.core.query_handler import (
+    QueryResponse,
+    build_sql_prompt,
+    extract_sql,
+    get_is_sql_required_prompt,
+    get_nonsql_prompt,
+    parse_is_sql_required,
+    set_response_df,
+    write_chat_history,
+)
+from text2sql.backend.core.result_cache import aexecute_sql_cached
+from text2sql.backend.core.retrieval import aget_retrieval_context
+from text2sql.backend.core.semantic_cache import get_semantic_cache
+from text2sql.backend.core.sql_rewriter import apply_row_limit
+from text2sql.backend.core.sql_validator import get_sql_validator
+from text2sql.backend.embedding_handler import agenerate_embeddings_openai
+
+logger = logging.getLogger(__name__)
+
+
+async def aget_query_response(
+    query: str,
+    username: str,
+    access_token: str,
+    role: Optional[str] = None,
+    conversation_history: list[ChatCompletionMessageParam] = [],
+    session_id: Optional[str] = None,
+) -> AsyncGenerator[QueryResponse, None]:
+    """Async counterpart of get_query_response for callers outside the Streamlit script
+    thread. The question is recorded in chat_history like get_query_response does; a
+    caller without sessions of its own leaves session_id out and each question counts
+    as its own session."""
+    start = time.perf_counter()
+    usage = PromptUsage()
+    request_usage.set(usage)
+    response = None
+    state = "cancelled"
+    try:
+        async for response in _aget_query_response(
+            query, username, access_token, role, conversation_history
+        ):
+            yield response
+        state = "error" if response is None or response.error else "success"
+    except Exception:
+        state = "error"
+        raise
+    finally:
+        request_usage.set(None)
+        if response is not None:
+            await asyncio.to_thread(
+                write_chat_history,
+                query,
+                response,
+                state,
+                (time.perf_counter() - start) * 1000,
+                usage,
+                session_id or str(response.id),
+                username,
+            )
+
+
+async def _aget_query_response(
+    query: str,
+    username: str,
+    access_token: str,
+    role: Optional[str],
+    conversation_history: list[ChatCompletionMessageParam],
+) -> AsyncGenerator[QueryResponse, None]:
+    role_task = None
+    if role is None:
+        role_task = asyncio.create_task(aget_current_role(username, access_token))
+
+    # Without the router, the embedding and the LLM intent check are independent, so
+    # run them together
+    sql_required_task = None
+    if not settings.intent_router.enabled:
+        sql_required_task = asyncio.create_task(ais_sql_required(query))
+    embeddings = await agenerate_embeddings_openai(query)
+    if role_task is not None:
+        role = await role_task
+
+    if settings.semantic_cache.enabled:
+        cached = await asyncio.to_thread(get_semantic_cache().lookup, embeddings, role)
+        if cached is not None:
+            if sql_required_task is not None:
+                sql_required_task.cancel()
+            logger.info(f"\nQuestion: {query}\nServed From Semantic Cache")
+            async for response in aanswer_sql_question(
+                query, username, access_token, role, cached_sql=cached.sql
+            ):
+                yield response
+            return
+
+    speculative_sql = None
+    if sql_required_task is not None:
+        sql_required = await sql_required_task
+    else:
+        sql_required, speculative_sql = await aroute_question(query, embeddings)
+    logger.info(f"\nQuestion: {query}\nSQL Required: {sql_required}")
+    if sql_required is not None:
+        if sql_required:
+            response = aanswer_sql_question(
+                query, username, access_token, role, speculative_sql=speculative_sql
+            )
+        else:
+            response = aanswer_nonsql_question(query, conversation_history)
+        async for i in response:
+            yield i
+    else:
+        error_message = (
+            "Could Not Determine Whether SQL is Required to Answer the Question"
+        )
+        logger.error(error_message)
+        yield QueryResponse(role="assistant", error=error_message)
+
+
+async def aroute_question(
+    question: str, embeddings: list[float]
+) -> tuple[bool | None, asyncio.Task | None]:
+    router = get_intent_router()
+    speculative_sql = None
+
+    async def fallback(question: str) -> bool | None:
+        nonlocal speculative_sql
+        # Only worth speculating when routing needs a real LLM round trip
+        if settings.intent_router.speculative:
+            speculative_sql = asyncio.create_task(agenerate_sql(question))
+        return await ais_sql_required(question, client=get_async_openai_router_client())
+
+    decision = await router.aroute(question, embeddings, fallback)
+
+    if speculative_sql is not None:
+        if decision.sql_required:
+            router.record_speculation(used=True, overlap_ms=decision.latency_ms)
+        else:
+            speculative_sql.cancel()
+            router.record_speculation(used=False, overlap_ms=0)
+            speculative_sql = None
+
+    return decision.sql_required, speculative_sql
+
+
+async def ais_sql_required(
+    question: str, client: Optional[AsyncOpenAI] = None
+) -> bool | None:
+    output = await asubmit_prompt(get_is_sql_required_prompt(question), client=client)
+    return parse_is_sql_required(output)
+
+
+async def aanswer_nonsql_question(
+    query: str, convo_history: list[ChatCompletionMessageParam]
+) -> AsyncGenerator[QueryResponse, None]:
+    response = QueryResponse(role="assistant")
+
+    output = await asubmit_prompt(get_nonsql_prompt(query, convo_history))
+
+    if output is not None:
+        response.text = output
+    else:
+        response.error = "Failed to Get LLM Response"
+    yield response
+
+
+async def aanswer_sql_question(
+    question: str,
+    username: str,
+    access_token: str,
+    role: str,
+    cached_sql: Optional[str] = None,
+    speculative_sql: Optional[asyncio.Task] = None,
+) -> AsyncGenerator[QueryResponse, None]:
+    response = QueryResponse(role="assistant", cache_hit=cached_sql is not None)
+
+    sql = None
+    if cached_sql is not None:
+        sql = cached_sql
+        response.sql = sql
+    else:
+        if speculative_sql is not None:
+            llm_response = await speculative_sql
+        else:
+            llm_response = await agenerate_sql(question)
+
+        if llm_response is not None:
+            sql = extract_sql(llm_response.lstrip())
+            if sql is not None:
+                response.sql = sql
+            else:
+                response.text = llm_response
+        else:
+            response.error = "Failed to generate SQL. Please try rephrase your question 🙏"
+
+    yield response
+
+    if not sql:
+        return
+
+    if settings.sql_validation.enabled:
+        response.validation = await asyncio.to_thread(get_sql_validator().validate, sql)
+        if not response.validation.valid:
+            response.error = f"SQL is invalid. Please try rephrase your question 🙏\n{response.validation.get_message()}"
+            yield response
+            return
+
+    limited = apply_row_limit(sql, settings.snowflake.max_display_rows)
+    response.row_limit = limited.row_limit
+    df = await aexecute_sql_cached(
+        sql=limited.sql, username=username, access_token=access_token, role=role
+    )
+
+    if df is not None:
+        set_response_df(response, df)
+        yield response
+
+        if cached_sql is None and settings.semantic_cache.enabled:
+            embeddings = await agenerate_embeddings_openai(question)
+            get_semantic_cache().store(
+                question=question, embedding=embeddings, sql=sql, role=role
+            )
+
+        chart_result = await agenerate_chart(question, sql, response.df)
+        if chart_result:
+            response.plotly_code, response.plotly_figure = chart_result
+            yield response
+    else:
+        response.error = "SQL is invalid. Please try rephrase your question 🙏"
+        yield response
+
+
+async def agenerate_sql(question: str) -> str | None:
+    context = await aget_retrieval_context(question)
+    prompt = build_sql_prompt(context)
+    llm_response = await asubmit_prompt(prompt)
+    logger.info(f"LLM Response:\n{llm_response}")
+
+    return llm_response
@@ -0,0 +1,120 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Optional
+
+import pandas as pd
+
+from text2sql.backend.config import ChartCacheSettings, settings
+
+logger = logging.getLogger(__name__)
+
+stopwords = set(
+    "a an the of for in on by to and or with me show give list what which is are was "
+    "were please can you i we our my how many much".split()
+)
+
+
+@dataclass
+class ChartCacheEntry:
+    code: str
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ChartCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    validation_failures: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def get_row_count_bucket(n_rows: int) -> int:
+    # Powers of ten: charts for 8 and 9 rows look alike, 8 and 8000 don't
+    return math.ceil(math.log10(n_rows)) if n_rows > 1 else 0
+
+
+def get_schema_signature(df: pd.DataFrame) -> str:
+    columns = ",".join(f"{i}:{j}" for i, j in df.dtypes.items())
+    return f"{columns}|rows~1e{get_row_count_bucket(len(df))}"
+
+
+def normalize_intent(question: Optional[str]) -> str:
+    """Lowercased question with literals and filler words removed, so questions that
+    differ only in the dates, numbers or names they filter on share an intent."""
+    if not question:
+        return ""
+    text = question.lower()
+    text = re.sub(r"'[^']*'|\"[^\"]*\"", " <str> ", text)
+    text = re.sub(r"\d+(?:[./-]\d+)*", " <num> ", text)
+    words = re.findall(r"<\w+>|[a-z_]+", text)
+    return " ".join(i for i in words if i not in stopwords)
+
+
+class ChartCodeCache:
+    """LLM-written Plotly code keyed by result schema signature and question intent."""
+
+    def __init__(self, config: ChartCacheSettings):
+        self.config = config
+        self.stats = ChartCacheStats()
+        self._entries: OrderedDict[str, ChartCacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, df: pd.DataFrame, question: Optional[str]) -> str:
+        key = f"{get_schema_signature(df)}\n{normalize_intent(question)}"
+        return blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry.created_at > self.config.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                    self.stats.evictions += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry.code
+
+    def set(self, key: str, code: str) -> None:
+        with self._lock:
+            self._entries[key] = ChartCacheEntry(code=code)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def discard(self, key: str) -> None:
+        """Drop code that no longer runs against a result with the same signature."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.stats.validation_failures += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hit_rate,
+            "evictions": self.stats.evictions,
+            "validation_failures": self.stats.validation_failures,
+        }
+
+
+@lru_cache
+def get_chart_cache() -> ChartCodeCache:
+    return ChartCodeCache(config=settings.chart_cache)
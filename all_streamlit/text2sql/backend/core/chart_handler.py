@@ -2,7 +2,22 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from typing import Optional
-from text2sql.backend.connectors.my_openai import system_message, user_message, submit_prompt
+from text2sql.backend.config import settings
+from text2sql.backend.connectors.my_openai import (
+    asubmit_prompt,
+    system_message,
+    user_message,
+    submit_prompt,
+)
+from text2sql.backend.core.chart_cache import get_chart_cache
+from text2sql.backend.core.chart_planner import get_chart_planner
+from text2sql.backend.core.chart_sandbox import get_chart_sandbox
+from text2sql.backend.core.chart_reduction import (
+    apply_webgl,
+    get_payload_bytes,
+    reduce_chart_data,
+)
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +26,22 @@ logger = logging.getLogger(__name__)
 def generate_plotly_code(
     df_metadata: pd.Series, question: Optional[str], sql: Optional[str] = None
 ) -> str | None:
+    message_log = get_plotly_prompt(df_metadata, question, sql)
+    raw_plotly_code = submit_prompt(message_log)
+    return process_plotly_code(raw_plotly_code)
+
+
+async def agenerate_plotly_code(
+    df_metadata: pd.Series, question: Optional[str], sql: Optional[str] = None
+) -> str | None:
+    message_log = get_plotly_prompt(df_metadata, question, sql)
+    raw_plotly_code = await asubmit_prompt(message_log)
+    return process_plotly_code(raw_plotly_code)
+
+
+def get_plotly_prompt(
+    df_metadata: pd.Series, question: Optional[str], sql: Optional[str] = None
+) -> list:
     if question is not None:
         system_msg = f"The following is a pandas DataFrame that contains the results of the query that answers the question the user asked: '{question}'"
     else:
@@ -26,9 +57,10 @@ def generate_plotly_code(
             "Can you generate the Python plotly code to chart the results of the dataframe? Assume the data is in a pandas dataframe called 'df'. If there is only one value in the dataframe, use an Indicator. Respond with only Python code. Do not answer with any explanations -- just the code."
         ),
     ]
+    return message_log
 
-    raw_plotly_code = submit_prompt(message_log)
 
+def process_plotly_code(raw_plotly_code: str | None) -> str | None:
     if raw_plotly_code is not None:
         processed = raw_plotly_code.replace("fig.show()", "")
         final_plotly_code = processed.strip("```").strip("python")
@@ -58,31 +90,10 @@ def get_plotly_figure(
     Returns:
         plotly.graph_objs.Figure: The Plotly figure.
     """
-    ldict = {"df": df, "px": px, "go": go}
     try:
-        exec(plotly_code, globals(), ldict)
-
-        fig = ldict.get("fig", None)
+        fig = run_plotly_code(plotly_code, df)
     except Exception as e:
-        # Inspect data types
-        numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
-        categorical_cols = df.select_dtypes(
-            include=["object", "category"]
-        ).columns.tolist()
-
-        # Decision-making for plot type
-        if len(numeric_cols) >= 2:
-            # Use the first two numeric columns for a scatter plot
-            fig = px.scatter(df, x=numeric_cols[0], y=numeric_cols[1])
-        elif len(numeric_cols) == 1 and len(categorical_cols) >= 1:
-            # Use a bar plot if there's one numeric and one categorical column
-            fig = px.bar(df, x=categorical_cols[0], y=numeric_cols[0])
-        elif len(categorical_cols) >= 1 and df[categorical_cols[0]].nunique() < 10:
-            # Use a pie chart for categorical data with fewer unique values
-            fig = px.pie(df, names=categorical_cols[0])
-        else:
-            # Default to a simple line plot if above conditions are not met
-            fig = px.line(df)
+        return get_fallback_figure(df, dark_mode=dark_mode)
 
     if fig is None:
         return None
@@ -90,21 +101,194 @@ def get_plotly_figure(
     if dark_mode:
         fig.update_layout(template="plotly_dark")
 
-    return fig
+    return apply_webgl(fig, settings.chart_reduction.webgl_threshold)
+
+
+def get_fallback_figure(df: pd.DataFrame, dark_mode: bool = True) -> go.Figure | None:
+    """A chart picked from the column types alone, for when chart code fails."""
+    # Inspect data types
+    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    categorical_cols = df.select_dtypes(
+        include=["object", "category"]
+    ).columns.tolist()
+
+    # Decision-making for plot type
+    if len(numeric_cols) >= 2:
+        # Use the first two numeric columns for a scatter plot
+        fig = px.scatter(df, x=numeric_cols[0], y=numeric_cols[1])
+    elif len(numeric_cols) == 1 and len(categorical_cols) >= 1:
+        # Use a bar plot if there's one numeric and one categorical column
+        fig = px.bar(df, x=categorical_cols[0], y=numeric_cols[0])
+    elif len(categorical_cols) >= 1 and df[categorical_cols[0]].nunique() < 10:
+        # Use a pie chart for categorical data with fewer unique values
+        fig = px.pie(df, names=categorical_cols[0])
+    elif numeric_cols:
+        # Default to a simple line plot of the measure; plotting every column
+        # produces huge figures for wide results
+        fig = px.line(df, y=numeric_cols[0])
+    else:
+        return None
+
+    if dark_mode:
+        fig.update_layout(template="plotly_dark")
+
+    return apply_webgl(fig, settings.chart_reduction.webgl_threshold)
+
+
+def run_plotly_code(
+    plotly_code: str, df: pd.DataFrame, sandboxed: bool = True
+) -> go.Figure | None:
+    # LLM-written code runs out of process; the planner's own code is trusted
+    if sandboxed and settings.chart_sandbox.enabled:
+        return get_chart_sandbox().run(plotly_code, df)
+
+    ldict = {"df": df, "px": px, "go": go}
+    exec(plotly_code, globals(), ldict)
+    return ldict.get("fig", None)
+
+
+def try_plotly_code(
+    plotly_code: str, df: pd.DataFrame, sandboxed: bool = True
+) -> go.Figure | None:
+    """The figure the code draws, or None if it fails; unlike get_plotly_figure there
+    is no heuristic fallback."""
+    try:
+        fig = run_plotly_code(plotly_code, df, sandboxed=sandboxed)
+    except Exception as e:
+        logger.info(f"Plotly code failed: {e}")
+        return None
+    if fig is None:
+        return None
+    fig.update_layout(template="plotly_dark")
+    return apply_webgl(fig, settings.chart_reduction.webgl_threshold)
 
 
 def generate_chart(
     question: str, sql: str, df: pd.DataFrame
-) -> tuple[str | None, go.Figure | None] | None:  
+) -> tuple[str | None, go.Figure | None] | None:
+    df = prepare_chart_data(df)
+
+    result = plan_chart(question, df) or get_cached_chart(question, df)
+    if result is None:
+        if len(df) > 1: # Plot when df has more than 1 record
+            get_chart_planner().record("llm")
+            code = generate_plotly_code(question=question, sql=sql, df_metadata=df.dtypes)
+            fig = None
+
+            if code is not None and code != "":
+                fig = render_llm_chart(question, code, df)
+
+            result = (code, fig)
+        else:
+            get_chart_planner().record("none")
+
+    log_chart_payload(result)
+    return result
+
+
+async def agenerate_chart(
+    question: str, sql: str, df: pd.DataFrame
+) -> tuple[str | None, go.Figure | None] | None:
+    df = await asyncio.to_thread(prepare_chart_data, df)
 
-    if len(df) > 1: # Plot when df has more than 1 record
-        code = generate_plotly_code(question=question, sql=sql, df_metadata=df.dtypes)
-        fig = None
+    result = await asyncio.to_thread(plan_chart, question, df)
+    if result is None:
+        result = await asyncio.to_thread(get_cached_chart, question, df)
+    if result is None:
+        if len(df) > 1:
+            get_chart_planner().record("llm")
+            code = await agenerate_plotly_code(
+                question=question, sql=sql, df_metadata=df.dtypes
+            )
+            fig = None
 
-        if code is not None and code != "":
-            fig = get_plotly_figure(plotly_code=code, df=df)
+            if code is not None and code != "":
+                fig = await asyncio.to_thread(render_llm_chart, question, code, df)
 
-        return (code, fig)
+            result = (code, fig)
+        else:
+            get_chart_planner().record("none")
 
-    else:
+    await asyncio.to_thread(log_chart_payload, result)
+    return result
+
+
+def prepare_chart_data(df: pd.DataFrame) -> pd.DataFrame:
+    if not settings.chart_reduction.enabled:
+        return df
+
+    reduced, report = reduce_chart_data(df, settings.chart_reduction)
+    if report.method != "none":
+        logger.info(
+            f"Chart data reduced by {report.method} from {report.rows_in} to {report.rows_out} rows"
+            + (
+                f", {report.hidden_categories} categories grouped as Other"
+                if report.hidden_categories
+                else ""
+            )
+        )
+    return reduced
+
+
+def log_chart_payload(result: tuple[str | None, go.Figure | None] | None) -> None:
+    if result is None or result[1] is None:
+        return
+    logger.info(f"Chart payload: {get_payload_bytes(result[1]) / 1024:.1f} KB")
+
+
+def plan_chart(
+    question: str, df: pd.DataFrame
+) -> tuple[str, go.Figure] | None:
+    if not settings.chart_planner.enabled:
+        return None
+
+    planner = get_chart_planner()
+    plan = planner.plan(df, question)
+    if plan is None:
         return None
+
+    code = plan.to_code()
+    fig = try_plotly_code(code, df, sandboxed=False)
+    if fig is None:
+        logger.warning(f"Planned {plan.kind} chart failed, falling back to LLM")
+        return None
+
+    planner.record("planner")
+    logger.info(f"Chart Planner chose a {plan.kind} chart")
+    return (code, fig)
+
+
+def get_cached_chart(
+    question: str, df: pd.DataFrame
+) -> tuple[str, go.Figure] | None:
+    if not settings.chart_cache.enabled:
+        return None
+
+    cache = get_chart_cache()
+    key = cache.get_key(df, question)
+    code = cache.get(key)
+    if code is None:
+        return None
+
+    # A matching signature doesn't guarantee the code still runs, e.g. on null-only columns
+    fig = try_plotly_code(code, df)
+    if fig is None:
+        cache.discard(key)
+        return None
+
+    get_chart_planner().record("cache")
+    logger.info("Chart Code Served From Cache")
+    return (code, fig)
+
+
+def render_llm_chart(question: str, code: str, df: pd.DataFrame) -> go.Figure | None:
+    fig = try_plotly_code(code, df)
+    if fig is None:
+        # Running the failed code again would cost another sandbox timeout
+        return get_fallback_figure(df)
+
+    # Only code that ran as written is worth reusing
+    if settings.chart_cache.enabled:
+        cache = get_chart_cache()
+        cache.set(cache.get_key(df, question), code)
+    return fig
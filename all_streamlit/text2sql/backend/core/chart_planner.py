@@ -0,0 +1,195 @@
+import datetime
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Literal, Optional
+
+import pandas as pd
+
+from text2sql.backend.config import ChartPlannerSettings, settings
+
+logger = logging.getLogger(__name__)
+
+share_pattern = re.compile(
+    r"\b(share|proportion|percent|percentage|breakdown|split|composition|mix)\b",
+    re.IGNORECASE,
+)
+
+id_pattern = re.compile(r"(^|_)ID$", re.IGNORECASE)
+
+
+@dataclass
+class ChartPlan:
+    kind: Literal["indicator", "bar", "line", "scatter", "pie"]
+    x: Optional[str] = None
+    y: list[str] = field(default_factory=list)
+    color: Optional[str] = None
+
+    def to_code(self) -> str:
+        """Plotly code for the plan, in the same form the LLM is asked to write."""
+        y = repr(self.y[0]) if len(self.y) == 1 else repr(self.y)
+        color = f", color={self.color!r}" if self.color else ""
+
+        match self.kind:
+            case "indicator":
+                return (
+                    f"fig = go.Figure(go.Indicator(mode='number', value=df[{self.y[0]!r}].iloc[0], "
+                    f"title={{'text': {self.y[0]!r}}}))"
+                )
+            case "pie":
+                return f"fig = px.pie(df, names={self.x!r}, values={y})"
+            case "line":
+                return f"fig = px.line(df.sort_values({self.x!r}), x={self.x!r}, y={y}{color}, markers=True)"
+            case "bar":
+                barmode = ", barmode='group'" if len(self.y) > 1 or self.color else ""
+                return f"fig = px.bar(df, x={self.x!r}, y={y}{color}{barmode})"
+            case "scatter":
+                return f"fig = px.scatter(df, x={self.x!r}, y={y}{color})"
+
+
+@dataclass
+class ChartStats:
+    planner_charts: int = 0
+    llm_charts: int = 0
+    cached_charts: int = 0
+    no_chart: int = 0
+
+
+@dataclass
+class ColumnRoles:
+    time: list[str]
+    numeric: list[str]
+    categorical: list[str]
+
+
+def get_column_roles(df: pd.DataFrame) -> ColumnRoles:
+    roles = ColumnRoles(time=[], numeric=[], categorical=[])
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series) or _holds_dates(series):
+            roles.time.append(column)
+        elif pd.api.types.is_bool_dtype(series):
+            roles.categorical.append(column)
+        elif pd.api.types.is_numeric_dtype(series):
+            # Identifiers are numbers but don't belong on a value axis
+            if id_pattern.search(str(column)):
+                roles.categorical.append(column)
+            else:
+                roles.numeric.append(column)
+        else:
+            roles.categorical.append(column)
+    return roles
+
+
+def _holds_dates(series: pd.Series) -> bool:
+    # Arrow hands Snowflake DATE columns over as object columns of datetime.date
+    if series.dtype != object:
+        return False
+    values = series.dropna()
+    return not values.empty and isinstance(values.iloc[0], (datetime.date, datetime.datetime))
+
+
+class ChartPlanner:
+    """Picks a chart from the shape of the result (column types, cardinality, time
+    columns and row count) without an LLM call. Returns None for shapes it doesn't
+    recognise, which are left to the LLM."""
+
+    def __init__(self, config: ChartPlannerSettings):
+        self.config = config
+        self.stats = ChartStats()
+        self._lock = threading.Lock()
+
+    def plan(self, df: pd.DataFrame, question: Optional[str] = None) -> ChartPlan | None:
+        if df.empty:
+            return None
+
+        roles = get_column_roles(df)
+        numeric = roles.numeric[: self.config.max_series]
+        n_rows = len(df)
+
+        if n_rows == 1:
+            if len(roles.numeric) == 1 and len(df.columns) <= 2:
+                return ChartPlan(kind="indicator", y=roles.numeric)
+            return None
+
+        if not numeric:
+            return None
+
+        if roles.time:
+            x = roles.time[0]
+            color = self._get_color(df, roles.categorical)
+            if color and len(numeric) == 1:
+                return ChartPlan(kind="line", x=x, y=numeric, color=color)
+            if not roles.categorical:
+                return ChartPlan(kind="line", x=x, y=numeric)
+            return None
+
+        if not roles.categorical:
+            if len(numeric) >= 2:
+                return ChartPlan(kind="scatter", x=numeric[0], y=numeric[1:2])
+            return None
+
+        x = roles.categorical[0]
+        n_categories = df[x].nunique()
+        if n_categories > self.config.max_categories:
+            return None
+
+        if len(roles.categorical) == 1:
+            if (
+                len(numeric) == 1
+                and n_categories == n_rows
+                and n_categories <= self.config.max_pie_slices
+                and (df[numeric[0]] >= 0).all()
+                and question is not None
+                and share_pattern.search(question)
+            ):
+                return ChartPlan(kind="pie", x=x, y=numeric)
+            return ChartPlan(kind="bar", x=x, y=numeric)
+
+        color = self._get_color(df, roles.categorical[1:])
+        if color and len(roles.categorical) == 2 and len(numeric) == 1:
+            return ChartPlan(kind="bar", x=x, y=numeric, color=color)
+        return None
+
+    def record(self, source: Literal["planner", "llm", "cache", "none"]) -> None:
+        with self._lock:
+            match source:
+                case "planner":
+                    self.stats.planner_charts += 1
+                case "llm":
+                    self.stats.llm_charts += 1
+                case "cache":
+                    self.stats.cached_charts += 1
+                case "none":
+                    self.stats.no_chart += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            charts = (
+                self.stats.planner_charts
+                + self.stats.llm_charts
+                + self.stats.cached_charts
+            )
+            return {
+                "planner_charts": self.stats.planner_charts,
+                "llm_charts": self.stats.llm_charts,
+                "cached_charts": self.stats.cached_charts,
+                "no_chart": self.stats.no_chart,
+                "planner_ratio": self.stats.planner_charts / charts if charts else 0.0,
+                "llm_ratio": self.stats.llm_charts / charts if charts else 0.0,
+                "cache_ratio": self.stats.cached_charts / charts if charts else 0.0,
+            }
+
+    def _get_color(self, df: pd.DataFrame, categorical: list[str]) -> str | None:
+        if len(categorical) != 1:
+            return None
+        if df[categorical[0]].nunique() > self.config.max_color_groups:
+            return None
+        return categorical[0]
+
+
+@lru_cache
+def get_chart_planner() -> ChartPlanner:
+    return ChartPlanner(config=settings.chart_planner)
@@ -0,0 +1,208 @@
+import base64
+import logging
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from text2sql.backend.config import ChartReductionSettings
+from text2sql.backend.core.chart_planner import get_column_roles
+
+logger = logging.getLogger(__name__)
+
+# Measures that can't be added up across categories
+non_additive_pattern = re.compile(
+    r"(avg|average|mean|median|ratio|rate|pct|percent|share)", re.IGNORECASE
+)
+
+
+@dataclass
+class ReductionReport:
+    # "+stride" marks a method whose output still needed thinning
+    method: str
+    rows_in: int
+    rows_out: int
+    # Categories folded into the "Other" bucket
+    hidden_categories: int = 0
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: keeps the first and last points and, from each
+    bucket in between, the point forming the largest triangle with its neighbours, so
+    peaks and troughs survive downsampling. x must be sorted."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if end <= start:
+            continue
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices.append(a)
+    indices.append(n - 1)
+    return np.asarray(indices)
+
+
+def reduce_chart_data(
+    df: pd.DataFrame, config: ChartReductionSettings
+) -> tuple[pd.DataFrame, ReductionReport]:
+    """Shrink a result larger than max_points to what a chart can usefully show: LTTB
+    for time series, the top N categories plus "Other", 2D binning for scatter plots
+    and, failing those or when they still leave too many rows, evenly spaced rows.
+    Smaller results are left alone."""
+    n_rows = len(df)
+    if n_rows <= config.max_points:
+        return df, ReductionReport("none", n_rows, n_rows)
+
+    roles = get_column_roles(df)
+    reduced, method = None, "stride"
+    hidden_categories = 0
+
+    if roles.time and roles.numeric:
+        reduced = _reduce_time_series(
+            df, roles.time[0], roles.numeric[0], roles.categorical, config
+        )
+        method = "lttb"
+    elif (
+        len(roles.categorical) == 1
+        and roles.numeric
+        and df[roles.categorical[0]].nunique() > config.top_n_categories
+    ):
+        reduced, hidden_categories = _reduce_categories(
+            df, roles.categorical[0], roles.numeric, config
+        )
+        method = "top_n"
+    elif not roles.categorical and len(roles.numeric) >= 2:
+        reduced = _bin_scatter(df, roles.numeric, config)
+        method = "binning"
+
+    if reduced is None:
+        reduced, method = df, "stride"
+    if len(reduced) > config.max_points:
+        step = int(np.ceil(len(reduced) / config.max_points))
+        reduced = reduced.iloc[::step]
+        if method != "stride":
+            method = f"{method}+stride"
+    return reduced, ReductionReport(method, n_rows, len(reduced), hidden_categories)
+
+
+def _reduce_time_series(
+    df: pd.DataFrame,
+    time_column: str,
+    value_column: str,
+    categorical: list[str],
+    config: ChartReductionSettings,
+) -> pd.DataFrame | None:
+    if len(categorical) > 1:
+        return None
+    if categorical and df[categorical[0]].nunique() > config.max_series:
+        return None
+
+    df = df.sort_values(time_column)
+    if categorical:
+        groups = [j for _, j in df.groupby(categorical[0], sort=False)]
+    else:
+        groups = [df]
+    n_out = max(config.max_points // len(groups), 3)
+
+    reduced = []
+    for group in groups:
+        x = pd.to_datetime(group[time_column]).to_numpy(dtype="datetime64[ns]")
+        y = np.nan_to_num(group[value_column].to_numpy(dtype=float))
+        indices = lttb_indices(x.astype(np.int64).astype(float), y, n_out)
+        reduced.append(group.iloc[indices])
+    return pd.concat(reduced)
+
+
+def _reduce_categories(
+    df: pd.DataFrame, category: str, numeric: list[str], config: ChartReductionSettings
+) -> tuple[pd.DataFrame, int]:
+    """The rows of the top N categories, ranked by the first measure, plus one "Other"
+    row for the rest. Counts and sums are added up into it; averages and ratios can't
+    be, so they get their plain mean and the bucket says so."""
+    measure = numeric[0]
+    additive = not non_additive_pattern.search(str(measure))
+    groups = df.groupby(category, sort=False)[measure]
+    totals = groups.sum() if additive else groups.mean()
+    top = totals.nlargest(config.top_n_categories).index
+
+    kept = df[df[category].isin(top)]
+    rest = df[~df[category].isin(top)]
+    other = {
+        column: (
+            rest[column].mean()
+            if non_additive_pattern.search(str(column))
+            else rest[column].sum()
+        )
+        for column in numeric
+    }
+    other[category] = "Other" if additive else "Other (average)"
+    reduced = pd.concat([kept, pd.DataFrame([other])], ignore_index=True)
+    return reduced, rest[category].nunique()
+
+
+def _bin_scatter(
+    df: pd.DataFrame, numeric: list[str], config: ChartReductionSettings
+) -> pd.DataFrame:
+    # At most n_bins x n_bins points, so the grid fits in max_points
+    n_bins = max(int(np.sqrt(config.max_points)), 1)
+    x, y = numeric[0], numeric[1]
+    # NaN would land in the last bin and show up as points in the far corner
+    binned = df.dropna(subset=[x, y]).copy()
+    for column in (x, y):
+        values = binned[column].astype(float)
+        edges = np.linspace(values.min(), values.max(), n_bins + 1)
+        centers = (edges[:-1] + edges[1:]) / 2
+        bins = np.clip(np.digitize(values, edges[1:-1]), 0, n_bins - 1)
+        binned[column] = centers[bins]
+
+    # Each point now stands for a bin; other measures are averaged within it
+    return binned.groupby([x, y], as_index=False)[df.columns.drop([x, y]).tolist()].mean()[
+        df.columns
+    ]
+
+
+def apply_webgl(fig: go.Figure, threshold: int) -> go.Figure:
+    """Swap SVG scatter and line traces for their WebGL version when the figure has
+    more points than the browser can comfortably draw as SVG."""
+    n_points = sum(
+        _get_length(i.x) for i in fig.data if getattr(i, "x", None) is not None
+    )
+    if n_points <= threshold or not any(i.type == "scatter" for i in fig.data):
+        return fig
+
+    traces = []
+    for trace in fig.data:
+        if trace.type == "scatter":
+            properties = trace.to_plotly_json()
+            properties.pop("type", None)
+            traces.append(go.Scattergl(**properties))
+        else:
+            traces.append(trace)
+    return go.Figure(data=traces, layout=fig.layout)
+
+
+def _get_length(values) -> int:
+    # Figures rebuilt from JSON hold numeric arrays base64 encoded (plotly>=6)
+    if isinstance(values, dict) and "bdata" in values:
+        data = base64.b64decode(values["bdata"])
+        return len(data) // np.dtype(values["dtype"]).itemsize
+    return len(values)
+
+
+def get_payload_bytes(fig: go.Figure) -> int:
+    return len(fig.to_json())
@@ -0,0 +1,197 @@
+import gc
+import logging
+import multiprocessing
+import queue
+import resource
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
+
+from text2sql.backend.config import ChartSandboxSettings, settings
+
+logger = logging.getLogger(__name__)
+
+
+class ChartSandboxError(Exception):
+    pass
+
+
+@dataclass
+class ChartTask:
+    plotly_code: str
+    shm_name: str
+    size: int
+
+
+@dataclass
+class SandboxStats:
+    runs: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    crashes: int = 0
+
+
+def write_shared_table(df: pd.DataFrame) -> tuple[SharedMemory, int]:
+    """The DataFrame as an Arrow IPC stream in a new shared memory block."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # Measure first so the stream is written straight into shared memory
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    with pa.ipc.new_stream(
+        pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), table.schema
+    ) as writer:
+        writer.write_table(table)
+    return shm, size
+
+
+def _render(task: ChartTask, shm: SharedMemory) -> str | None:
+    table = pa.ipc.open_stream(pa.py_buffer(shm.buf[: task.size])).read_all()
+    ldict = {"df": table.to_pandas(), "px": px, "go": go}
+    exec(task.plotly_code, {}, ldict)
+    fig = ldict.get("fig", None)
+    return fig.to_json() if fig is not None else None
+
+
+def _worker_main(conn: Connection, cpu_seconds: int, memory_bytes: int) -> None:
+    # Runs in the sandbox process: everything here is bounded by the rlimits, and a
+    # breach of the CPU limit kills the process with SIGXCPU
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+    while True:
+        try:
+            task: ChartTask = conn.recv()
+        except EOFError:
+            return
+
+        # RLIMIT_CPU counts the whole process lifetime, so move it on per task
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, cpu_hard))
+
+        # Workers share the parent's resource tracker, which unlinks the block once
+        shm = SharedMemory(name=task.shm_name)
+        try:
+            conn.send((_render(task, shm), None))
+        except BaseException as e:
+            conn.send((None, f"{type(e).__name__}: {e}"))
+        finally:
+            gc.collect()
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+
+class _Worker:
+    def __init__(self, ctx, config: ChartSandboxSettings):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, config.cpu_seconds, config.memory_bytes),
+            name="chart-sandbox",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ChartSandbox:
+    """Runs chart code in a small pool of pre-started processes with CPU time and
+    address space limits, so a runaway snippet only ever costs its own worker.
+
+    The DataFrame is handed over as Arrow IPC in shared memory and the figure comes
+    back as JSON. A worker that overruns the wall timeout or dies is killed and
+    replaced without disturbing the others.
+    """
+
+    def __init__(self, config: ChartSandboxSettings):
+        self.config = config
+        self.stats = SandboxStats()
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._ctx.set_forkserver_preload(["pandas", "pyarrow", "plotly.express"])
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._lock = threading.Lock()
+        for _ in range(config.pool_size):
+            self._idle.put(_Worker(self._ctx, config))
+
+    def run(self, plotly_code: str, df: pd.DataFrame) -> go.Figure | None:
+        try:
+            worker = self._idle.get(timeout=self.config.checkout_timeout_seconds)
+        except queue.Empty:
+            raise ChartSandboxError("No chart sandbox worker available")
+        if not worker.process.is_alive():
+            worker = self._replace(worker)
+
+        shm = None
+        start = time.perf_counter()
+        try:
+            shm, size = write_shared_table(df)
+            worker.conn.send(ChartTask(plotly_code=plotly_code, shm_name=shm.name, size=size))
+
+            if not worker.conn.poll(self.config.timeout_seconds):
+                self._record("timeouts")
+                worker = self._replace(worker)
+                raise ChartSandboxError(
+                    f"Chart code timed out after {self.config.timeout_seconds}s"
+                )
+            try:
+                fig_json, error = worker.conn.recv()
+            except EOFError:
+                # Killed by the CPU or memory limit
+                self._record("crashes")
+                worker = self._replace(worker)
+                raise ChartSandboxError("Chart code exceeded its resource limits")
+        finally:
+            self._idle.put(worker)
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        self._record("runs")
+        logger.info(f"Chart code ran in sandbox in {(time.perf_counter() - start) * 1000:.0f}ms")
+        if error is not None:
+            self._record("failures")
+            raise ChartSandboxError(error)
+        return pio.from_json(fig_json) if fig_json is not None else None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.stats.runs,
+                "failures": self.stats.failures,
+                "timeouts": self.stats.timeouts,
+                "crashes": self.stats.crashes,
+            }
+
+    def _record(self, name: str) -> None:
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        return _Worker(self._ctx, self.config)
+
+
+@lru_cache
+def get_chart_sandbox() -> ChartSandbox:
+    return ChartSandbox(config=settings.chart_sandbox)
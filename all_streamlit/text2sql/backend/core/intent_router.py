@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Literal
+
+import numpy as np
+from opensearchpy import OpenSearch
+
+from text2sql.backend.config import IntentRouterSettings, settings
+from text2sql.backend.connectors.clients import get_opensearch_client
+from text2sql.backend.core.semantic_cache import get_training_fingerprint
+from text2sql.backend.data_prep import QuestionSQL
+from text2sql.backend.embedding_handler import generate_embeddings_openai
+
+logger = logging.getLogger(__name__)
+
+labeled_examples = [
+    ("How many customers opened an account last month?", True),
+    ("What is the total deposit balance by product as of yesterday?", True),
+    ("Show me the daily number of card transactions this week", True),
+    ("List the top 10 merchants by transaction amount in 2024", True),
+    ("What is the average loan amount disbursed per customer?", True),
+    ("How many users logged in to the app today?", True),
+    ("Give me the monthly trend of active customers", True),
+    ("Which customers have more than 3 savings accounts?", True),
+    ("What was the fraud rate for last quarter?", True),
+    ("Break down new sign-ups by age group", True),
+    ("Hi, how are you?", False),
+    ("Thank you!", False),
+    ("What can you help me with?", False),
+    ("What is the difference between a LEFT JOIN and an INNER JOIN?", False),
+    ("Explain what a window function is", False),
+    ("Can you explain the SQL you just gave me?", False),
+    ("Who built this tool?", False),
+    ("Tell me a joke", False),
+    ("How do I format a date in Snowflake?", False),
+    ("What does this error message mean?", False),
+]
+
+
+@dataclass
+class RoutingDecision:
+    sql_required: bool | None
+    source: Literal["classifier", "llm"]
+    confidence: float
+    latency_ms: float
+
+
+@dataclass
+class RouterStats:
+    classifier_decisions: int = 0
+    llm_decisions: int = 0
+    speculative_used: int = 0
+    speculative_discarded: int = 0
+    latency_saved_ms: float = 0.0
+
+
+class IntentRouter:
+    """Decides whether a question needs SQL from its nearest labeled examples,
+    falling back to an LLM call only when the neighbours disagree."""
+
+    def __init__(self, config: IntentRouterSettings, client: OpenSearch | None = None):
+        self.config = config
+        self.client = client
+        self.stats = RouterStats()
+        self._llm_latency_ms = config.assumed_llm_latency_ms
+        self._labeled: list[list[float]] | None = None
+        self._embeddings: np.ndarray | None = None
+        self._labels: np.ndarray | None = None
+        self._fingerprint: tuple | None = None
+        self._fingerprint_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def route(
+        self,
+        question: str,
+        embeddings: list[float],
+        fallback: Callable[[str], bool | None],
+    ) -> RoutingDecision:
+        start = time.perf_counter()
+        sql_required, confidence = self._classify(embeddings)
+        if sql_required is not None:
+            return self._record(sql_required, "classifier", confidence, start)
+        return self._record(fallback(question), "llm", confidence, start)
+
+    async def aroute(
+        self,
+        question: str,
+        embeddings: list[float],
+        fallback: Callable[[str], Awaitable[bool | None]],
+    ) -> RoutingDecision:
+        start = time.perf_counter()
+        # Loading or reloading the examples goes to OpenSearch
+        sql_required, confidence = await asyncio.to_thread(self._classify, embeddings)
+        if sql_required is not None:
+            return self._record(sql_required, "classifier", confidence, start)
+        return self._record(await fallback(question), "llm", confidence, start)
+
+    def record_speculation(self, used: bool, overlap_ms: float) -> None:
+        with self._lock:
+            if used:
+                self.stats.speculative_used += 1
+                self.stats.latency_saved_ms += overlap_ms
+            else:
+                self.stats.speculative_discarded += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            decisions = self.stats.classifier_decisions + self.stats.llm_decisions
+            return {
+                "classifier_decisions": self.stats.classifier_decisions,
+                "llm_decisions": self.stats.llm_decisions,
+                "classifier_ratio": (
+                    self.stats.classifier_decisions / decisions if decisions else 0.0
+                ),
+                "speculative_used": self.stats.speculative_used,
+                "speculative_discarded": self.stats.speculative_discarded,
+                "latency_saved_ms": self.stats.latency_saved_ms,
+            }
+
+    def _record(
+        self,
+        sql_required: bool | None,
+        source: Literal["classifier", "llm"],
+        confidence: float,
+        start: float,
+    ) -> RoutingDecision:
+        decision = RoutingDecision(
+            sql_required=sql_required,
+            source=source,
+            confidence=confidence,
+            latency_ms=(time.perf_counter() - start) * 1000,
+        )
+        with self._lock:
+            if source == "classifier":
+                self.stats.classifier_decisions += 1
+                self.stats.latency_saved_ms += self._llm_latency_ms - decision.latency_ms
+            else:
+                self.stats.llm_decisions += 1
+                # Moving average of real LLM routing latency, used to estimate savings
+                self._llm_latency_ms = 0.8 * self._llm_latency_ms + 0.2 * decision.latency_ms
+
+        logger.info(
+            f"Intent Routing: sql_required={decision.sql_required} source={decision.source} "
+            f"confidence={decision.confidence:.2f} latency={decision.latency_ms:.0f}ms"
+        )
+        return decision
+
+    def _classify(self, embeddings: list[float]) -> tuple[bool | None, float]:
+        examples, labels = self._get_examples()
+        query = np.asarray(embeddings, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        similarities = examples @ query
+        nearest = np.argsort(similarities)[::-1][: self.config.n_neighbors]
+        weights = np.clip(similarities[nearest], 0, None)
+        if weights.sum() == 0:
+            return None, 0.0
+
+        p_sql = float(weights @ labels[nearest] / weights.sum())
+        confidence = abs(2 * p_sql - 1)
+
+        if (
+            similarities[nearest[0]] < self.config.min_similarity
+            or confidence < self.config.min_margin
+        ):
+            return None, confidence
+        return p_sql >= 0.5, confidence
+
+    def _get_examples(self) -> tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._labeled is None:
+                texts = [i for i, _ in labeled_examples]
+                self._labeled = generate_embeddings_openai(tuple(texts))
+
+            now = time.time()
+            if self._embeddings is not None and (
+                now - self._fingerprint_checked_at < self.config.examples_check_interval_seconds
+            ):
+                return self._embeddings, self._labels
+            self._fingerprint_checked_at = now
+
+            fingerprint = self._get_fingerprint()
+            if self._embeddings is None or fingerprint != self._fingerprint:
+                # Verified questions are all SQL questions and already carry embeddings
+                verified = self._load_verified_questions()
+                embeddings = self._labeled + verified
+                labels = np.asarray(
+                    [float(j) for _, j in labeled_examples] + [1.0] * len(verified),
+                    dtype=np.float32,
+                )
+
+                matrix = np.asarray(embeddings, dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._embeddings = matrix / np.where(norms == 0, 1.0, norms)
+                self._labels = labels
+                self._fingerprint = fingerprint
+                logger.info(f"Intent Router loaded {len(labels)} labeled examples")
+
+            return self._embeddings, self._labels
+
+    def _get_fingerprint(self) -> tuple | None:
+        if self.client is None:
+            return None
+        try:
+            return get_training_fingerprint(self.client)
+        except Exception as e:
+            logger.warning(f"Intent Router could not check the training data: {e}")
+            # Keep the loaded examples rather than reloading on every failure
+            return self._fingerprint
+
+    def _load_verified_questions(self) -> list[list[float]]:
+        if self.client is None:
+            return []
+        try:
+            response = self.client.search(
+                index=QuestionSQL.opensearch_index_name,
+                body={
+                    "size": self.config.max_verified_examples,
+                    "query": {"match_all": {}},
+                    "_source": ["question_emb"],
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Intent Router could not load verified questions: {e}")
+            return []
+        return [hit["_source"]["question_emb"] for hit in response["hits"]["hits"]]
+
+
+@lru_cache
+def get_intent_router() -> IntentRouter:
+    return IntentRouter(config=settings.intent_router, client=get_opensearch_client())
@@ -0,0 +1,132 @@
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import tiktoken
+
+from text2sql.backend.config import PromptBudgetSettings
+from text2sql.backend.core.retrieval import RetrievalContext
+
+
+@lru_cache
+def get_encoding(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text))
+
+
+def abbreviate_ddl(ddl: str) -> str:
+    # Column comments are the bulk of most DDL; names and types are what the model needs
+    ddl = re.sub(r"\s+COMMENT\s*=?\s*'(?:[^']|'')*'", "", ddl, flags=re.IGNORECASE)
+    return " ".join(ddl.split())
+
+
+@dataclass
+class PromptBudgetReport:
+    budget: int
+    section_tokens: dict[str, int] = field(default_factory=dict)
+    dropped: dict[str, int] = field(default_factory=dict)
+    abbreviated: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.section_tokens.values())
+
+
+@dataclass
+class _Candidate:
+    section: str
+    score: float
+    text: str
+    value: str | dict
+
+
+def pack_context(
+    context: RetrievalContext, config: PromptBudgetSettings
+) -> tuple[RetrievalContext, PromptBudgetReport]:
+    """Keep the highest-scoring DDL, docs and examples that fit in the token budget.
+
+    Items that don't fit whole are abbreviated (DDL) or truncated (docs) when enough
+    budget remains, otherwise dropped.
+    """
+    sections = {
+        "examples": (context.question_sql_list, context.question_sql_scores),
+        "ddl": (context.ddl_list, context.ddl_scores),
+        "doc": (context.doc_list, context.doc_scores),
+    }
+    candidates = []
+    for section, (items, scores) in sections.items():
+        if len(scores) != len(items):
+            # Without scores, retrieval order is the best relevance signal there is
+            scores = [-float(i) for i in range(len(items))]
+        for value, score in zip(items, scores):
+            text = f"{value['question']}\n{value['sql']}" if section == "examples" else value
+            candidates.append(_Candidate(section, score, text, value))
+    # Text breaks ties so equally relevant items always come out in the same order,
+    # which keeps the prompt prefix stable for the provider's cache
+    candidates.sort(key=lambda i: (-i.score, i.text))
+
+    report = PromptBudgetReport(budget=config.max_context_tokens)
+    kept: dict[str, list[tuple[float, str | dict]]] = {"examples": [], "ddl": [], "doc": []}
+    remaining = config.max_context_tokens
+
+    for candidate in candidates:
+        n_tokens = count_tokens(candidate.text, config.model)
+        value = candidate.value
+
+        if n_tokens > remaining:
+            value, n_tokens = _shrink(candidate, remaining, config)
+            if value is None:
+                report.dropped[candidate.section] = (
+                    report.dropped.get(candidate.section, 0) + 1
+                )
+                continue
+            report.abbreviated[candidate.section] = (
+                report.abbreviated.get(candidate.section, 0) + 1
+            )
+
+        kept[candidate.section].append((candidate.score, value))
+        report.section_tokens[candidate.section] = (
+            report.section_tokens.get(candidate.section, 0) + n_tokens
+        )
+        remaining -= n_tokens
+
+    # Each section keeps the candidate order: most relevant first, ties by text
+    packed = RetrievalContext(
+        question=context.question,
+        embeddings=context.embeddings,
+        question_sql_list=[j for _, j in kept["examples"]],
+        ddl_list=[j for _, j in kept["ddl"]],
+        doc_list=[j for _, j in kept["doc"]],
+        question_sql_scores=[i for i, _ in kept["examples"]],
+        ddl_scores=[i for i, _ in kept["ddl"]],
+        doc_scores=[i for i, _ in kept["doc"]],
+    )
+    return packed, report
+
+
+def _shrink(
+    candidate: _Candidate, remaining: int, config: PromptBudgetSettings
+) -> tuple[str | None, int]:
+    if remaining < config.min_item_tokens:
+        return None, 0
+
+    match candidate.section:
+        case "ddl":
+            abbreviated = abbreviate_ddl(candidate.text)
+            n_tokens = count_tokens(abbreviated, config.model)
+            if n_tokens <= remaining:
+                return abbreviated, n_tokens
+            return None, 0
+        case "doc":
+            encoding = get_encoding(config.model)
+            tokens = encoding.encode(candidate.text)[:remaining]
+            return encoding.decode(tokens), len(tokens)
+        case _:
+            # A few-shot example is only useful whole
+            return None, 0
@@ -1,32 +1,60 @@
+import contextvars
 import logging
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Generator, Literal, Optional
 from uuid import UUID, uuid4
 import streamlit as st
 import pandas as pd
+from openai import OpenAI
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from plotly.graph_objs import Figure
 from pydantic import BaseModel, Field
 import snowflake.connector
+from text2sql.backend.chat_analytics import get_chat_history_maintainer
+from text2sql.backend.config import settings
+from text2sql.backend.connectors.clients import (
+    get_openai_chat_client,
+    get_openai_router_client,
+)
 from text2sql.backend.connectors.my_openai import (
+    PromptUsage,
+    request_usage,
     submit_prompt,
+    submit_prompt_stream,
     system_message,
     user_message,
     assistant_message,
+    wait_for_usage,
 )
-from text2sql.backend.connectors.my_snowflake import execute_sql
-from text2sql.backend.core.chart_handler import generate_chart
-from text2sql.backend.core.retrieval import (
-    get_related_ddl,
-    get_related_documentation,
-    get_similar_question_sql,
+from text2sql.backend.connectors.my_snowflake import (
+    QueryProgress,
+    get_current_role,
+    query_registry,
 )
+from text2sql.backend.connectors.postgres import insert_chat_history
+from text2sql.backend.connectors.snowflake_pool import get_token_manager
+from text2sql.backend.core.chart_handler import generate_chart
+from text2sql.backend.core.intent_router import get_intent_router
+from text2sql.backend.core.prompt_builder import count_tokens, pack_context
+from text2sql.backend.core.result_cache import execute_sql_cached, stream_sql_cached
+from text2sql.backend.core.retrieval import RetrievalContext, get_retrieval_context
+from text2sql.backend.core.semantic_cache import get_semantic_cache
+from text2sql.backend.core.sql_rewriter import apply_row_limit
+from text2sql.backend.core.sql_validator import ValidationResult, get_sql_validator
+from text2sql.backend.embedding_handler import generate_embeddings_openai
 from text2sql.frontend.auth import auth_by_refresh_token
 from streamlit.logger import get_logger
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 logging.basicConfig(level=logging.INFO)
 # logger = logging.getLogger(__name__)
 logger = get_logger(__name__)
 
+# Runs SQL generation speculatively while the router waits on its LLM fallback
+speculative_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative")
+
 dialect = "Snowflake"
 initial_prompt = f"At GXS Bank, a digitable bank in Singapore, you are a {dialect} SQL expert to help internal teams with their questions related GXS's data using SQL knowledge. Reply the message only if it is related to GXS bank's data or SQL questions"
 response_guidelines = "\n".join(
@@ -51,8 +79,16 @@ class QueryResponse(BaseModel):
     error: Optional[str] = None
     sql: Optional[str] = None
     df: Optional[pd.DataFrame] = None
+    # df holds at most row_limit rows; sql stays unlimited for load more and export
+    row_limit: Optional[int] = None
+    truncated: bool = False
+    validation: Optional[ValidationResult] = None
+    # Snowflake execution status while the SQL runs, for an in-flight indicator
+    query_progress: Optional[QueryProgress] = None
     plotly_code: Optional[str] = None
     plotly_figure: Optional[Figure] = None
+    # Answered from the semantic or result cache
+    cache_hit: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -62,11 +98,106 @@ def get_query_response(
     query: str,
     conversation_history: list[ChatCompletionMessageParam] = [],
 ) -> Generator[QueryResponse, None, None]:
-    sql_required = is_sql_required(query)
+    """Answer the question, then record it in chat_history with its latency, LLM token
+    usage and whether a cache answered it."""
+    start = time.perf_counter()
+    usage = PromptUsage()
+    request_usage.set(usage)
+    response = None
+    state = "cancelled"
+    try:
+        for response in _get_query_response(query, conversation_history):
+            yield response
+        state = "error" if response is None or response.error else "success"
+    except Exception:
+        state = "error"
+        raise
+    finally:
+        request_usage.set(None)
+        record_chat_history(
+            query, response, state, (time.perf_counter() - start) * 1000, usage
+        )
+
+
+def record_chat_history(
+    question: str,
+    response: Optional[QueryResponse],
+    state: str,
+    latency_ms: float,
+    usage: PromptUsage,
+) -> None:
+    session_id = get_session_id()
+    email = st.session_state.get("username")
+    if session_id is None or email is None:
+        return
+    write_chat_history(question, response, state, latency_ms, usage, session_id, email)
+
+
+def write_chat_history(
+    question: str,
+    response: Optional[QueryResponse],
+    state: str,
+    latency_ms: float,
+    usage: PromptUsage,
+    session_id: str,
+    email: str,
+) -> None:
+    if response is None:
+        return
+    try:
+        # The tail of a streamed SQL answer is still being read for its usage
+        wait_for_usage(usage, timeout=settings.chat_analytics.usage_wait_seconds)
+        insert_chat_history(
+            {
+                "chat_id": str(response.id),
+                "session_id": session_id,
+                "email": email,
+                "question": question,
+                "generated_sql": response.sql,
+                "state": state,
+                "latency_ms": round(latency_ms),
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cache_hit": response.cache_hit,
+            }
+        )
+        # Keeps partitions, the rollup and retention current while the app runs
+        get_chat_history_maintainer()
+    except Exception as e:
+        logger.error(f"Failed to record chat history: {e}")
+
+
+def _get_query_response(
+    query: str,
+    conversation_history: list[ChatCompletionMessageParam],
+) -> Generator[QueryResponse, None, None]:
+    session_id = get_session_id()
+    if session_id is not None:
+        # Anything still running for this session belongs to a question it moved on from
+        query_registry.cancel_session(session_id)
+
+    embeddings = generate_embeddings_openai(query)
+
+    if settings.semantic_cache.enabled:
+        cached = get_semantic_cache().lookup(embeddings, get_snowflake_role())
+        if cached is not None:
+            logger.info(f"\nQuestion: {query}\nServed From Semantic Cache")
+            yield from answer_sql_question(
+                query, conversation_history, cached_sql=cached.sql
+            )
+            return
+
+    speculative_sql = None
+    if settings.intent_router.enabled:
+        sql_required, speculative_sql = route_question(query, embeddings)
+    else:
+        sql_required = is_sql_required(query)
     logger.info(f"\nQuestion: {query}\nSQL Required: {sql_required}")
     if sql_required is not None:
         if sql_required:
-            response = answer_sql_question(query, conversation_history)
+            response = answer_sql_question(
+                query, conversation_history, speculative_sql=speculative_sql
+            )
         else:
             response = answer_nonsql_question(query, conversation_history)
     else:
@@ -80,17 +211,53 @@ def get_query_response(
     
 
 
-def is_sql_required(question: str) -> bool | None:
+def route_question(
+    question: str, embeddings: list[float]
+) -> tuple[bool | None, Future | None]:
+    router = get_intent_router()
+    speculative_sql = None
+
+    def fallback(question: str) -> bool | None:
+        nonlocal speculative_sql
+        # Only worth speculating when routing needs a real LLM round trip
+        if settings.intent_router.speculative:
+            # Run in a copy of the context so its token usage counts towards the question
+            speculative_sql = speculative_executor.submit(
+                contextvars.copy_context().run, generate_sql, question
+            )
+        return is_sql_required(question, client=get_openai_router_client())
+
+    decision = router.route(question, embeddings, fallback)
+
+    if speculative_sql is not None:
+        if decision.sql_required:
+            router.record_speculation(used=True, overlap_ms=decision.latency_ms)
+        else:
+            speculative_sql.cancel()
+            router.record_speculation(used=False, overlap_ms=0)
+            speculative_sql = None
+
+    return decision.sql_required, speculative_sql
+
+
+def is_sql_required(
+    question: str, client: OpenAI = get_openai_chat_client()
+) -> bool | None:
+    output = submit_prompt(get_is_sql_required_prompt(question), client=client)
+    return parse_is_sql_required(output)
+
+
+def get_is_sql_required_prompt(question: str) -> list[ChatCompletionMessageParam]:
     prompt = f"""
     question: {question}
     Is this question requesting data from a SQL database? Should this question answered by a SQL?
     Only answer by "yes" or "no"
     """
-    system_prompt = initial_prompt + "\n" + response_guidelines
-    final = [system_message(system_prompt), user_message(prompt)]
+    system_prompt = canonicalize_prompt_text(initial_prompt + "\n" + response_guidelines)
+    return [system_message(system_prompt), user_message(prompt)]
 
-    output = submit_prompt(final)
 
+def parse_is_sql_required(output: str | None) -> bool | None:
     if output:
         match output.lower():
             case "yes":
@@ -101,19 +268,71 @@ def is_sql_required(question: str) -> bool | None:
         return None
 
 
+def get_nonsql_prompt(
+    query: str, convo_history: list[ChatCompletionMessageParam]
+) -> list[ChatCompletionMessageParam]:
+    prompt = f"{query}"
+    return [system_message(initial_prompt)] + convo_history + [user_message(prompt)]
+
+
+def extract_sql(llm_response: str) -> str | None:
+    if llm_response.startswith("```sql"):
+        return llm_response.strip("\n").strip("```").strip("sql")
+    return None
+
+
+def stream_llm_response(
+    chunks: Generator[str, None, None], response: QueryResponse
+) -> Generator[QueryResponse, None, str | None]:
+    """Yield partial text or SQL as tokens arrive and return the full LLM response.
+
+    A fenced SQL answer is cut off at its closing fence, so execution can start
+    without waiting for anything the model adds after the statement.
+    """
+    sql_fence = "```sql"
+    buffer = ""
+    is_sql = None
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            text = buffer.lstrip()
+
+            if is_sql is None:
+                if len(text) < len(sql_fence):
+                    continue
+                is_sql = text.startswith(sql_fence)
+
+            if is_sql:
+                end = text.find("```", len(sql_fence))
+                if end != -1:
+                    buffer = text[: end + 3]
+                    break
+                response.sql = text[len(sql_fence) :].strip("\n")
+            else:
+                response.text = buffer
+            yield response
+    finally:
+        chunks.close()
+
+    return buffer or None
+
+
 def answer_nonsql_question(
     query: str, convo_history: list[ChatCompletionMessageParam]
 ) -> Generator[QueryResponse, None, None]:
     response = QueryResponse(role="assistant")
 
-    prompt = f"{query}"
-    final_prompt = (
-        [system_message(initial_prompt)] + convo_history + [user_message(prompt)]
-    )
+    final_prompt = get_nonsql_prompt(query, convo_history)
     logger.info(final_prompt)
     
     store_prompt(final_prompt)
-    output = submit_prompt(final_prompt)
+    if settings.azure_openai.stream_chat:
+        output = yield from stream_llm_response(
+            submit_prompt_stream(final_prompt), response
+        )
+    else:
+        output = submit_prompt(final_prompt)
 
     if output is not None:
         response.text = output
@@ -123,48 +342,106 @@ def answer_nonsql_question(
 
 
 def answer_sql_question(
-    question: str, conversation_history: list[ChatCompletionMessageParam]
+    question: str,
+    conversation_history: list[ChatCompletionMessageParam],
+    cached_sql: Optional[str] = None,
+    speculative_sql: Optional[Future] = None,
 ) -> Generator[QueryResponse, None, None]:
-    response = QueryResponse(role="assistant")
+    response = QueryResponse(role="assistant", cache_hit=cached_sql is not None)
     
     sql = None
-    llm_response = generate_sql(question=question)
-    
-    if llm_response is not None:
-        if llm_response.startswith("```sql"):
-            sql = llm_response.strip("\n").strip("```").strip("sql")
-            response.sql = sql
-        else:
-            response.text = llm_response
+    if cached_sql is not None:
+        sql = cached_sql
+        response.sql = sql
     else:
-        response.error = "Failed to generate SQL. Please try rephrase your question 🙏"
+        if speculative_sql is not None:
+            llm_response = speculative_sql.result()
+        elif settings.azure_openai.stream_chat:
+            llm_response = yield from stream_llm_response(
+                submit_prompt_stream(get_generate_sql_prompt(question)), response
+            )
+        else:
+            llm_response = generate_sql(question=question)
+
+        if llm_response is not None:
+            sql = extract_sql(llm_response.lstrip())
+            if sql is not None:
+                response.sql = sql
+                response.text = None
+            else:
+                response.text = llm_response
+                response.sql = None
+        else:
+            response.error = "Failed to generate SQL. Please try rephrase your question 🙏"
 
     yield response
 
     if not sql:
         return None
 
-    username = st.session_state["username"]
-    access_token = st.session_state["access_token"]
+    if settings.sql_validation.enabled:
+        response.validation = get_sql_validator().validate(sql)
+        if not response.validation.valid:
+            response.error = f"SQL is invalid. Please try rephrase your question 🙏\n{response.validation.get_message()}"
+            yield response
+            return None
+
+    limited = apply_row_limit(sql, settings.snowflake.max_display_rows)
+    response.row_limit = limited.row_limit
+
+    username, access_token = get_snowflake_credentials()
+    role = get_snowflake_role()
+    df = None
     try:
-        df = execute_sql(sql=sql, username=username, access_token=access_token)
+        for progress, result in stream_sql_cached(
+            limited.sql, username, access_token, role, session_id=get_session_id()
+        ):
+            response.query_progress = progress
+            match progress.state:
+                case "running":
+                    yield response
+                case "fetching":
+                    # Show the first batch while the rest of the result arrives
+                    set_response_df(response, result)
+                    yield response
+                case "complete":
+                    df = result
+                    # Results served from the result cache have no query id
+                    response.cache_hit = response.cache_hit or progress.query_id is None
+                case "cancelled":
+                    return
+                case "timed_out":
+                    response.error = f"The query took longer than {settings.snowflake.query_timeout_seconds}s and was cancelled. Please try a narrower question 🙏"
+                    yield response
+                    return
     except snowflake.connector.errors.DatabaseError:
+        # Tokens are normally refreshed ahead of expiry, so this is only a last resort
         logger.info(
             "Access ooken expired. Attempt to renew it via refresh token before executing SQL query"
         )
         refresh_token = st.context.cookies.get("refresh_token")
         if refresh_token:
             auth_by_refresh_token(refresh_token, username)
-            access_token = st.session_state["access_token"]
-            df = execute_sql(sql=sql, username=username, access_token=access_token)
+            username, access_token = get_snowflake_credentials()
+            df = execute_sql_cached(
+                sql=limited.sql, username=username, access_token=access_token, role=role
+            )
         else:
             raise snowflake.connector.errors.DatabaseError
 
     if df is not None:
-        response.df = df
+        set_response_df(response, df)
         yield response
 
-        chart_result = generate_chart(question, sql, df)
+        if cached_sql is None and settings.semantic_cache.enabled:
+            get_semantic_cache().store(
+                question=question,
+                embedding=generate_embeddings_openai(question),
+                sql=sql,
+                role=role,
+            )
+
+        chart_result = generate_chart(question, sql, response.df)
         if chart_result:
             response.plotly_code, response.plotly_figure = chart_result
             yield response
@@ -175,18 +452,37 @@ def answer_sql_question(
     # return response
 
 
-def generate_sql(question: str, allow_llm_to_see_data=False) -> str | None:
-    question_sql_list = get_similar_question_sql(question)
-    ddl_list = get_related_ddl(question)
-    doc_list = get_related_documentation(question)
-    prompt = get_sql_prompt(
-        initial_prompt=initial_prompt,
-        question=question,
-        question_sql_list=question_sql_list,
-        ddl_list=ddl_list,
-        doc_list=doc_list,
+def set_response_df(response: QueryResponse, df: pd.DataFrame) -> None:
+    # The limited SQL fetches one row past the limit, which is how truncation shows up
+    response.truncated = response.row_limit is not None and len(df) > response.row_limit
+    response.df = df.head(response.row_limit) if response.truncated else df
+
+
+def load_more_rows(response: QueryResponse) -> QueryResponse:
+    """Re-run the original SQL with a larger row limit, for a "load more" action."""
+    if not response.truncated or response.sql is None:
+        return response
+
+    max_rows = min(
+        response.row_limit + settings.snowflake.max_display_rows,
+        settings.snowflake.max_load_more_rows,
     )
-    logger.info(f"SQL Prompt:\n{prompt}")
+    limited = apply_row_limit(response.sql, max_rows)
+    username, access_token = get_snowflake_credentials()
+    df = execute_sql_cached(
+        sql=limited.sql,
+        username=username,
+        access_token=access_token,
+        role=get_snowflake_role(),
+    )
+    if df is not None:
+        response.row_limit = limited.row_limit
+        set_response_df(response, df)
+    return response
+
+
+def generate_sql(question: str, allow_llm_to_see_data=False) -> str | None:
+    prompt = get_generate_sql_prompt(question)
     llm_response = submit_prompt(prompt)
     logger.info(f"LLM Response:\n{llm_response}")
     
@@ -222,6 +518,34 @@ def generate_sql(question: str, allow_llm_to_see_data=False) -> str | None:
     #                 return f"Error running intermediate SQL: {e}"
 
 
+def get_generate_sql_prompt(question: str) -> list[ChatCompletionMessageParam]:
+    return build_sql_prompt(get_retrieval_context(question))
+
+
+def build_sql_prompt(context: RetrievalContext) -> list[ChatCompletionMessageParam]:
+    packed, report = pack_context(context, settings.prompt_budget)
+    prompt = get_sql_prompt(
+        initial_prompt=initial_prompt,
+        question=context.question,
+        question_sql_list=packed.question_sql_list,
+        ddl_list=packed.ddl_list,
+        doc_list=packed.doc_list,
+    )
+
+    model = settings.prompt_budget.model
+    report.section_tokens["instructions"] = count_tokens(
+        initial_prompt + response_guidelines, model
+    )
+    report.section_tokens["question"] = count_tokens(context.question, model)
+    logger.info(
+        f"SQL Prompt Tokens: total={report.total_tokens} budget={report.budget} "
+        f"sections={report.section_tokens} dropped={report.dropped} "
+        f"abbreviated={report.abbreviated}"
+    )
+    logger.info(f"SQL Prompt:\n{prompt}")
+    return prompt
+
+
 def get_sql_prompt(
     initial_prompt: str,
     question: str,
@@ -230,15 +554,15 @@ def get_sql_prompt(
     doc_list: list,
     dialect="Snowflake",
 ):
-    system_prompt = f"""
-    {initial_prompt}
-    ===Tables DDL
-    {ddl_list}
-    ===Additional Context
-    {doc_list}
-    ===Response Guidelines
-    {response_guidelines}
-    """
+    # Static instructions come first and are byte-identical across requests (and
+    # match the is_sql_required system prompt) so the provider's prompt prefix cache
+    # can reuse them. Retrieved context follows in the order it is given, which
+    # pack_context makes most relevant first with ties broken by text, so the same
+    # context always renders the same way.
+    static_prompt = canonicalize_prompt_text(initial_prompt + "\n" + response_guidelines)
+    ddl_text = "\n\n".join(canonicalize_prompt_text(i) for i in ddl_list)
+    doc_text = "\n\n".join(canonicalize_prompt_text(i) for i in doc_list)
+    context_prompt = f"===Tables DDL\n{ddl_text}\n\n===Additional Context\n{doc_text}"
 
     # initial_prompt = add_ddl_to_prompt(initial_prompt, ddl_list, max_tokens=max_tokens)
     # if static_documentation != "":
@@ -258,20 +582,58 @@ def get_sql_prompt(
     #     f"6. Ensure that the output SQL is {dialect}-compliant and executable, and free of syntax errors. \n"
     # )
 
-    message_log = [system_message(system_prompt)]
+    message_log = [system_message(static_prompt), system_message(context_prompt)]
 
-    for example in question_sql_list:
-        if example is None:
-            print("example is None")
-        else:
-            if example is not None and "question" in example and "sql" in example:
-                message_log.append(user_message(example["question"]))
-                message_log.append(assistant_message(example["sql"]))
+    examples = [i for i in question_sql_list if i is not None]
+    for example in examples:
+        if "question" in example and "sql" in example:
+            message_log.append(user_message(example["question"]))
+            message_log.append(assistant_message(example["sql"]))
 
     message_log.append(user_message(question))
 
     return message_log
 
+
+def canonicalize_prompt_text(text: str) -> str:
+    lines = [line.rstrip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def get_snowflake_role() -> str:
+    """The Snowflake role the session's queries run under, which cached SQL and results
+    are scoped to. Resolved once per session."""
+    if "role" not in st.session_state:
+        username, access_token = get_snowflake_credentials()
+        try:
+            st.session_state["role"] = get_current_role(username, access_token)
+        except snowflake.connector.errors.Error as e:
+            # Scoping to the user is never wider than their role, so it is a safe
+            # fallback, but try again on the next question
+            logger.warning(f"Failed to resolve the Snowflake role of {username}: {e}")
+            return username
+    return st.session_state["role"]
+
+
+def get_session_id() -> Optional[str]:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def get_snowflake_credentials() -> tuple[str, str]:
+    """The session's username and an access token the token manager keeps fresh."""
+    username = st.session_state["username"]
+    token_manager = get_token_manager()
+    token_manager.register(
+        username,
+        st.session_state["access_token"],
+        st.context.cookies.get("refresh_token"),
+    )
+    access_token = token_manager.get_access_token(username)
+    st.session_state["access_token"] = access_token
+    return username, access_token
+
+
 def store_prompt(prompt:list[ChatCompletionMessageParam]):
     if "prompt_history" not in st.session_state:
         st.session_state.prompt_history = []
@@ -280,4 +642,5 @@ def store_prompt(prompt:list[ChatCompletionMessageParam]):
     st.session_state.prompt_history.append(prompt)
 
 def prepare_prompt_from_message_history(messages: list[QueryResponse]):
-    # st.session_state.latest_response = response
\ No newline at end of file
+    # st.session_state.latest_response = response
+    pass
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from hashlib import blake2b
+from typing import Generator, Optional
+
+import pandas as pd
+
+from text2sql.backend.config import ResultCacheSettings, settings
+from text2sql.backend.connectors.my_snowflake import (
+    QueryProgress,
+    snowflake_executor,
+    stream_sql,
+)
+from text2sql.backend.core.sql_rewriter import canonicalize_sql
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResultCacheEntry:
+    nbytes: int
+    df: Optional[pd.DataFrame] = None
+    # Set once the entry has been spilled out of memory
+    path: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ResultCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    spills: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+def get_result_key(sql: str, role: str) -> str:
+    return blake2b(
+        f"{role}\n{canonicalize_sql(sql)}".encode("utf-8"), digest_size=32
+    ).hexdigest()
+
+
+class ResultCache:
+    """Query results keyed by canonical SQL and Snowflake role.
+
+    Entries are evicted least recently used first once their total in-memory size
+    passes max_memory_bytes, and spilled to Parquet on local disk when enabled.
+    """
+
+    def __init__(self, config: ResultCacheSettings):
+        self.config = config
+        self.stats = ResultCacheStats()
+        self._memory: OrderedDict[str, ResultCacheEntry] = OrderedDict()
+        self._disk: OrderedDict[str, ResultCacheEntry] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if config.spill_enabled:
+            os.makedirs(config.spill_dir, exist_ok=True)
+
+    def get(self, sql: str, role: str) -> pd.DataFrame | None:
+        key = get_result_key(sql, role)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._is_expired(entry, now):
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                # A shallow copy so callers adding columns don't change the cached frame
+                return entry.df.copy(deep=False)
+
+            entry = self._disk.get(key)
+            if entry is None or self._is_expired(entry, now):
+                self.stats.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        try:
+            df = pd.read_parquet(entry.path)
+        except Exception as e:
+            logger.warning(f"Result Cache could not read spilled result: {e}")
+            with self._lock:
+                self._remove_from_disk(key)
+                self.stats.misses += 1
+            return None
+
+        with self._lock:
+            self.stats.disk_hits += 1
+        return df
+
+    def set(self, sql: str, role: str, df: pd.DataFrame) -> None:
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.config.max_entry_bytes:
+            logger.info(f"Result Cache skipped a {nbytes} byte result")
+            return
+
+        key = get_result_key(sql, role)
+        with self._lock:
+            self._remove_from_memory(key)
+            self._remove_from_disk(key)
+            self._memory[key] = ResultCacheEntry(nbytes=nbytes, df=df)
+            self._memory_bytes += nbytes
+            self._evict(time.time())
+
+    def invalidate(self) -> None:
+        with self._lock:
+            for key in list(self._memory):
+                self._remove_from_memory(key)
+            for key in list(self._disk):
+                self._remove_from_disk(key)
+        logger.info("Result Cache Invalidated")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "memory_hits": self.stats.memory_hits,
+                "disk_hits": self.stats.disk_hits,
+                "misses": self.stats.misses,
+                "hit_rate": self.stats.hit_rate,
+                "evictions": self.stats.evictions,
+                "spills": self.stats.spills,
+            }
+
+    def _is_expired(self, entry: ResultCacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.config.ttl_seconds
+
+    def _evict(self, now: float) -> None:
+        for key in [i for i, j in self._memory.items() if self._is_expired(j, now)]:
+            self._remove_from_memory(key)
+            self.stats.evictions += 1
+        for key in [i for i, j in self._disk.items() if self._is_expired(j, now)]:
+            self._remove_from_disk(key)
+            self.stats.evictions += 1
+
+        while self._memory and self._memory_bytes > self.config.max_memory_bytes:
+            key, entry = next(iter(self._memory.items()))
+            self._remove_from_memory(key)
+            if not (self.config.spill_enabled and self._spill(key, entry)):
+                self.stats.evictions += 1
+
+        while self._disk and self._disk_bytes > self.config.max_disk_bytes:
+            self._remove_from_disk(next(iter(self._disk)))
+            self.stats.evictions += 1
+
+    def _spill(self, key: str, entry: ResultCacheEntry) -> bool:
+        path = os.path.join(self.config.spill_dir, f"{key}.parquet")
+        try:
+            entry.df.to_parquet(path, index=False)
+        except Exception as e:
+            logger.warning(f"Result Cache could not spill result to disk: {e}")
+            return False
+
+        self._disk[key] = ResultCacheEntry(
+            nbytes=os.path.getsize(path), path=path, created_at=entry.created_at
+        )
+        self._disk_bytes += self._disk[key].nbytes
+        self.stats.spills += 1
+        return True
+
+    def _remove_from_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.nbytes
+
+    def _remove_from_disk(self, key: str) -> None:
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry.nbytes
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def stream_sql_cached(
+    sql: str,
+    username: str,
+    access_token: str,
+    role: str,
+    session_id: Optional[str] = None,
+) -> Generator[tuple[QueryProgress, pd.DataFrame | None], None, None]:
+    """stream_sql served from the result cache when possible."""
+    cache = get_result_cache()
+    if settings.result_cache.enabled:
+        df = cache.get(sql, role)
+        if df is not None:
+            logger.info("Served From Result Cache")
+            yield QueryProgress(None, "complete", rows_produced=len(df)), df
+            return
+
+    for progress, df in stream_sql(sql, username, access_token, session_id=session_id):
+        if progress.state == "complete" and settings.result_cache.enabled:
+            cache.set(sql, role, df)
+        yield progress, df
+
+
+def execute_sql_cached(
+    sql: str, username: str, access_token: str, role: str
+) -> pd.DataFrame | None:
+    for progress, df in stream_sql_cached(sql, username, access_token, role):
+        if progress.state == "complete":
+            return df
+    return None
+
+
+async def aexecute_sql_cached(
+    sql: str, username: str, access_token: str, role: str
+) -> pd.DataFrame | None:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        snowflake_executor,
+        partial(
+            execute_sql_cached,
+            sql=sql,
+            username=username,
+            access_token=access_token,
+            role=role,
+        ),
+    )
+
+
+@lru_cache
+def get_result_cache() -> ResultCache:
+    return ResultCache(config=settings.result_cache)
@@ -1,10 +1,15 @@
+import asyncio
+import logging
 from dataclasses import dataclass, field
 
-from functools import lru_cache
-
-from text2sql.backend.connectors.clients import get_opensearch_client
+from text2sql.backend.connectors.clients import (
+    get_async_opensearch_client,
+    get_opensearch_client,
+)
 from text2sql.backend.embedding_handler import generate_embeddings_openai
 
+logger = logging.getLogger(__name__)
+
 n_results = 5
 opensearch_client = get_opensearch_client()
 
@@ -52,42 +57,89 @@ class QuestionSQL:
     # sql_emb: list[float] = field(metadata=opensearch_property_type_vector)
 
 
-@lru_cache
-def get_related_ddl(question: str) -> list[str]:
+@dataclass
+class RetrievalContext:
+    question: str
+    embeddings: list[float]
+    question_sql_list: list[dict] = field(default_factory=list)
+    ddl_list: list[str] = field(default_factory=list)
+    doc_list: list[str] = field(default_factory=list)
+    question_sql_scores: list[float] = field(default_factory=list)
+    ddl_scores: list[float] = field(default_factory=list)
+    doc_scores: list[float] = field(default_factory=list)
+
+
+def get_retrieval_context(question: str) -> RetrievalContext:
+    """Embed the question once and fetch DDL, docs and verified SQL in one msearch."""
     embeddings = generate_embeddings_openai(question)
+    response = opensearch_client.msearch(body=_get_msearch_body(embeddings))
+    return _parse_msearch_response(question, embeddings, response)
 
-    query = {
-        "query": {"knn": {"ddl_emb": {"vector": embeddings, "k": n_results}}},
-        "_source": ["ddl"],
-    }
-    response = opensearch_client.search(index=DDL.opensearch_index_name, body=query)
-    return [hit["_source"]["ddl"] for hit in response["hits"]["hits"]]
 
+async def aget_retrieval_context(question: str) -> RetrievalContext:
+    embeddings = await asyncio.to_thread(generate_embeddings_openai, question)
+    response = await get_async_opensearch_client().msearch(
+        body=_get_msearch_body(embeddings)
+    )
+    return _parse_msearch_response(question, embeddings, response)
 
-@lru_cache
-def get_related_documentation(question: str) -> list[dict]:
-    embeddings = generate_embeddings_openai(question)
 
-    query = {
-        "query": {"knn": {"doc_emb": {"vector": embeddings, "k": n_results}}},
-        "_source": ["doc"],
-    }
-    response = opensearch_client.search(index=Doc.opensearch_index_name, body=query)
-    return [hit["_source"]["doc"] for hit in response["hits"]["hits"]]
+def _get_msearch_body(embeddings: list[float]) -> list[dict]:
+    return [
+        {"index": QuestionSQL.opensearch_index_name},
+        {
+            "size": n_results,
+            "query": {"knn": {"question_emb": {"vector": embeddings, "k": n_results}}},
+            "_source": ["question", "sql"],
+        },
+        {"index": DDL.opensearch_index_name},
+        {
+            "size": n_results,
+            "query": {"knn": {"ddl_emb": {"vector": embeddings, "k": n_results}}},
+            "_source": ["ddl"],
+        },
+        {"index": Doc.opensearch_index_name},
+        {
+            "size": n_results,
+            "query": {"knn": {"doc_emb": {"vector": embeddings, "k": n_results}}},
+            "_source": ["doc"],
+        },
+    ]
 
 
-@lru_cache
-def get_similar_question_sql(question: str) -> list[dict]:
-    embeddings = generate_embeddings_openai(question)
+def _parse_msearch_response(
+    question: str, embeddings: list[float], response: dict
+) -> RetrievalContext:
+    question_sql_hits, ddl_hits, doc_hits = [
+        _get_hits(index_name, result)
+        for index_name, result in zip(
+            [
+                QuestionSQL.opensearch_index_name,
+                DDL.opensearch_index_name,
+                Doc.opensearch_index_name,
+            ],
+            response["responses"],
+        )
+    ]
 
-    query = {
-        "query": {"knn": {"question_emb": {"vector": embeddings, "k": n_results}}},
-        "_source": ["question", "sql"],
-    }
-    response = opensearch_client.search(
-        index=QuestionSQL.opensearch_index_name, body=query
+    return RetrievalContext(
+        question=question,
+        embeddings=embeddings,
+        question_sql_list=[
+            {"question": hit["_source"]["question"], "sql": hit["_source"]["sql"]}
+            for hit in question_sql_hits
+        ],
+        ddl_list=[hit["_source"]["ddl"] for hit in ddl_hits],
+        doc_list=[hit["_source"]["doc"] for hit in doc_hits],
+        question_sql_scores=[hit["_score"] for hit in question_sql_hits],
+        ddl_scores=[hit["_score"] for hit in ddl_hits],
+        doc_scores=[hit["_score"] for hit in doc_hits],
     )
-    return [
-        {"question": hit["_source"]["question"], "sql": hit["_source"]["sql"]}
-        for hit in response["hits"]["hits"]
-    ]
+
+
+def _get_hits(index_name: str, result: dict) -> list[dict]:
+    # msearch reports failures per sub-query instead of raising for the whole request
+    if "error" in result:
+        logger.error(f"Opensearch Retrieval Error on {index_name}: {result['error']}")
+        return []
+    return result["hits"]["hits"]
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+from opensearchpy import OpenSearch
+
+from text2sql.backend.config import SemanticCacheSettings, settings
+from text2sql.backend.connectors.clients import get_opensearch_client
+from text2sql.backend.data_prep import DDL, Doc, QuestionSQL
+
+logger = logging.getLogger(__name__)
+
+training_indices = [
+    DDL.opensearch_index_name,
+    Doc.opensearch_index_name,
+    QuestionSQL.opensearch_index_name,
+]
+
+
+@dataclass
+class SemanticCacheEntry:
+    question: str
+    embedding: np.ndarray
+    sql: str
+    role: str
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class SemanticCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def get_training_fingerprint(client: OpenSearch) -> tuple:
+    # Index uuids change when an index is recreated and the indexing counters move on
+    # every write or delete, so any change to the training data changes the fingerprint.
+    response = client.indices.stats(index=",".join(training_indices), metric="indexing")
+    return tuple(
+        (
+            name,
+            stats.get("uuid"),
+            stats["primaries"]["indexing"]["index_total"],
+            stats["primaries"]["indexing"]["delete_total"],
+        )
+        for name, stats in sorted(response["indices"].items())
+    )
+
+
+class SemanticCache:
+    """Generated SQL keyed by question embedding, scoped per Snowflake role."""
+
+    def __init__(
+        self,
+        config: SemanticCacheSettings,
+        client: OpenSearch | None = None,
+    ):
+        self.config = config
+        self.client = client
+        self.stats = SemanticCacheStats()
+        self._entries: OrderedDict[int, SemanticCacheEntry] = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._fingerprint: tuple | None = None
+        self._fingerprint_checked_at = 0.0
+
+    def lookup(self, embedding: list[float], role: str) -> SemanticCacheEntry | None:
+        self._check_training_data()
+        query = _normalize(embedding)
+        now = time.time()
+
+        with self._lock:
+            self._evict_expired(now)
+            candidates = [
+                (key, entry) for key, entry in self._entries.items() if entry.role == role
+            ]
+            if not candidates:
+                self.stats.misses += 1
+                return None
+
+            similarities = np.vstack([entry.embedding for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            best_similarity = float(similarities[best])
+
+            if best_similarity < self.config.similarity_threshold:
+                self.stats.misses += 1
+                logger.info(f"Semantic Cache Miss: best similarity {best_similarity:.4f}")
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            logger.info(
+                f"Semantic Cache Hit: similarity {best_similarity:.4f} with '{entry.question}'"
+            )
+            return entry
+
+    def store(self, question: str, embedding: list[float], sql: str, role: str) -> None:
+        entry = SemanticCacheEntry(
+            question=question, embedding=_normalize(embedding), sql=sql, role=role
+        )
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.invalidations += 1
+        logger.info("Semantic Cache Invalidated")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hit_rate,
+            "evictions": self.stats.evictions,
+            "invalidations": self.stats.invalidations,
+            "similarity_threshold": self.config.similarity_threshold,
+        }
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry.created_at > self.config.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+        self.stats.evictions += len(expired)
+
+    def _check_training_data(self) -> None:
+        if self.client is None:
+            return
+
+        now = time.time()
+        if now - self._fingerprint_checked_at < self.config.index_check_interval_seconds:
+            return
+        self._fingerprint_checked_at = now
+
+        try:
+            fingerprint = get_training_fingerprint(self.client)
+        except Exception as e:
+            logger.warning(f"Semantic Cache could not read training index stats: {e}")
+            return
+
+        if self._fingerprint is not None and fingerprint != self._fingerprint:
+            self.invalidate()
+        self._fingerprint = fingerprint
+
+
+def _normalize(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@lru_cache
+def get_semantic_cache() -> SemanticCache:
+    return SemanticCache(config=settings.semantic_cache, client=get_opensearch_client())
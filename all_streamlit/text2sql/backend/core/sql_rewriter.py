@@ -0,0 +1,90 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+logger = logging.getLogger(__name__)
+
+dialect = "snowflake"
+
+
+@dataclass
+class LimitedSQL:
+    sql: str
+    # Rows the caller may show; the SQL fetches one more so truncation can be detected
+    row_limit: Optional[int]
+
+
+def apply_row_limit(sql: str, max_rows: int) -> LimitedSQL:
+    """Add or cap the LIMIT of a query so at most max_rows + 1 rows come back.
+
+    A query that already asks for max_rows or fewer is returned unchanged. Anything
+    that isn't a query (SHOW, DESCRIBE, ...) or doesn't parse is returned unchanged
+    with no row limit.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read=dialect)
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Could not parse SQL to apply row limit: {e}")
+        return LimitedSQL(sql=sql, row_limit=None)
+
+    if not isinstance(tree, exp.Query):
+        return LimitedSQL(sql=sql, row_limit=None)
+
+    existing = get_limit_value(tree)
+    if existing is not None and existing <= max_rows:
+        return LimitedSQL(sql=sql, row_limit=existing)
+
+    if tree.args.get("limit") is not None and existing is None:
+        # The limit is an expression or bind parameter, so keep it and cap outside it
+        tree = exp.select("*").from_(tree.subquery("limited"))
+
+    limited = tree.limit(max_rows + 1, copy=False)
+    return LimitedSQL(sql=limited.sql(dialect=dialect), row_limit=max_rows)
+
+
+def get_limit_value(tree: exp.Query) -> Optional[int]:
+    limit = tree.args.get("limit")
+    if isinstance(limit, exp.Limit):
+        value = limit.expression
+    elif isinstance(limit, exp.Fetch):
+        options = limit.args.get("limit_options")
+        if options is not None and (options.args.get("percent") or options.args.get("with_ties")):
+            return None
+        value = limit.args.get("count")
+    else:
+        return None
+
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    return None
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Render SQL in one canonical form so trivially different queries share a key.
+
+    Formatting, keyword and unquoted identifier case, and table alias names are
+    normalized. SQL that doesn't parse falls back to whitespace normalization.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read=dialect)
+    except sqlglot.errors.ParseError:
+        return " ".join(sql.split())
+
+    tree = normalize_identifiers(tree, dialect=dialect)
+
+    aliases: dict[str, str] = {}
+    for table in tree.find_all(exp.Table):
+        if table.alias and table.alias not in aliases:
+            aliases[table.alias] = f"_T{len(aliases)}"
+    for table in tree.find_all(exp.Table):
+        if table.alias:
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[table.alias])))
+    for column in tree.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+
+    return tree.sql(dialect=dialect)
@@ -0,0 +1,268 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Literal, Optional
+
+import sqlglot
+from opensearchpy import OpenSearch, helpers
+from sqlglot import exp
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from text2sql.backend.config import SQLValidationSettings, settings
+from text2sql.backend.connectors.clients import get_opensearch_client
+from text2sql.backend.core.semantic_cache import get_training_fingerprint
+from text2sql.backend.core.sql_rewriter import dialect
+from text2sql.backend.data_prep import DDL
+
+logger = logging.getLogger(__name__)
+
+# Statements that can't change data or grants
+read_only_statements = (exp.Query, exp.Describe, exp.Show)
+
+
+@dataclass
+class ValidationError:
+    code: Literal[
+        "parse_error",
+        "multiple_statements",
+        "not_read_only",
+        "unknown_table",
+        "unknown_column",
+    ]
+    message: str
+
+
+@dataclass
+class ValidationResult:
+    errors: list[ValidationError] = field(default_factory=list)
+    latency_ms: float = 0.0
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def get_message(self) -> str:
+        return "\n".join(i.message for i in self.errors)
+
+
+@dataclass
+class TableInfo:
+    parts: tuple[str, ...]
+    # None for views and other objects whose columns the DDL doesn't list
+    columns: Optional[set[str]]
+
+
+def build_catalog(ddl_list: list[str]) -> list[TableInfo]:
+    """Tables and their columns from CREATE statements; statements that don't parse
+    are skipped."""
+    tables = []
+    for ddl in ddl_list:
+        try:
+            statements = sqlglot.parse(ddl, read=dialect)
+        except sqlglot.errors.ParseError as e:
+            logger.warning(f"Skipping DDL the validator could not parse: {e}")
+            continue
+
+        for statement in statements:
+            if not isinstance(statement, exp.Create):
+                continue
+            target = statement.this
+            if isinstance(target, exp.Schema):
+                columns = {
+                    i.name.upper()
+                    for i in target.expressions
+                    if isinstance(i, exp.ColumnDef)
+                }
+                table = target.this
+            else:
+                columns = None
+                table = target
+            if isinstance(table, exp.Table):
+                parts = tuple(i.name.upper() for i in table.parts)
+                tables.append(TableInfo(parts=parts, columns=columns or None))
+    return tables
+
+
+class SQLValidator:
+    """Checks generated SQL locally before it is sent to the warehouse: it must parse in
+    the Snowflake dialect, be read-only, and only reference tables and columns in the
+    DDL index."""
+
+    def __init__(self, config: SQLValidationSettings, client: OpenSearch | None = None):
+        self.config = config
+        self.client = client
+        self._catalog: list[TableInfo] = []
+        self._fingerprint: tuple | None = None
+        self._fingerprint_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def validate(self, sql: str) -> ValidationResult:
+        start = time.perf_counter()
+        result = ValidationResult(errors=self._validate(sql))
+        result.latency_ms = (time.perf_counter() - start) * 1000
+
+        if not result.valid:
+            logger.info(
+                f"SQL failed validation in {result.latency_ms:.1f}ms:\n{result.get_message()}"
+            )
+        return result
+
+    def _validate(self, sql: str) -> list[ValidationError]:
+        try:
+            statements = [i for i in sqlglot.parse(sql, read=dialect) if i is not None]
+        except sqlglot.errors.ParseError as e:
+            return [ValidationError("parse_error", f"SQL could not be parsed: {e}")]
+
+        if len(statements) != 1:
+            return [
+                ValidationError(
+                    "multiple_statements", "Exactly one SQL statement is expected"
+                )
+            ]
+
+        tree = statements[0]
+        if not isinstance(tree, read_only_statements):
+            return [
+                ValidationError(
+                    "not_read_only",
+                    f"Only read-only queries are allowed, got {tree.key.upper()}",
+                )
+            ]
+        if not isinstance(tree, exp.Query):
+            return []
+
+        catalog = self._get_catalog()
+        if not catalog:
+            # Nothing to resolve against, e.g. before any DDL has been uploaded
+            return []
+
+        errors = []
+        # Inner scopes come first, and a parent scope also lists the columns its
+        # correlated subqueries reference, so each column is checked only once
+        checked: set[int] = set()
+        for scope in traverse_scope(tree):
+            errors.extend(self._check_scope(scope, catalog, checked))
+
+        # The same unknown name can be reported from several scopes
+        return list({i.message: i for i in errors}.values())
+
+    def _check_scope(
+        self, scope: Scope, catalog: list[TableInfo], checked: set[int]
+    ) -> list[ValidationError]:
+        errors = []
+        for _, source in scope.selected_sources.values():
+            if isinstance(source, exp.Table) and self.config.check_tables:
+                if _find_table(source, catalog) is None:
+                    errors.append(
+                        ValidationError(
+                            "unknown_table",
+                            f"Table {source.sql(dialect=dialect)} does not exist",
+                        )
+                    )
+
+        if not self.config.check_columns:
+            return errors
+
+        for column in scope.columns:
+            if id(column) in checked:
+                continue
+
+            if column.table and column.table not in scope.sources:
+                # References an outer query, which is checked in its own scope
+                continue
+            checked.add(id(column))
+
+            name = column.name.upper()
+            if column.table:
+                columns = _get_source_columns(scope.sources[column.table], catalog)
+                resolvable = columns is None or name in columns
+            else:
+                resolvable = _is_resolvable(name, scope, catalog)
+
+            if not resolvable:
+                errors.append(
+                    ValidationError(
+                        "unknown_column", f"Column {column.sql(dialect=dialect)} does not exist"
+                    )
+                )
+        return errors
+
+    def _get_catalog(self) -> list[TableInfo]:
+        if self.client is None:
+            return []
+
+        with self._lock:
+            now = time.time()
+            if now - self._fingerprint_checked_at < self.config.catalog_check_interval_seconds:
+                return self._catalog
+            self._fingerprint_checked_at = now
+
+            try:
+                fingerprint = get_training_fingerprint(self.client)
+                if fingerprint != self._fingerprint:
+                    ddl_list = [
+                        hit["_source"]["ddl"]
+                        for hit in helpers.scan(
+                            self.client,
+                            index=DDL.opensearch_index_name,
+                            query={"query": {"match_all": {}}, "_source": ["ddl"]},
+                        )
+                    ]
+                    self._catalog = build_catalog(ddl_list)
+                    self._fingerprint = fingerprint
+                    logger.info(f"SQL Validator loaded {len(self._catalog)} tables")
+            except Exception as e:
+                logger.warning(f"SQL Validator could not load the DDL index: {e}")
+
+            return self._catalog
+
+
+def _find_table(table: exp.Table, catalog: list[TableInfo]) -> TableInfo | None:
+    # Either side may leave out the database and schema, so compare the trailing parts
+    # both have
+    parts = tuple(i.name.upper() for i in table.parts)
+    for info in catalog:
+        n = min(len(parts), len(info.parts))
+        if info.parts[-n:] == parts[-n:]:
+            return info
+    return None
+
+
+def _get_source_columns(source, catalog: list[TableInfo]) -> set[str] | None:
+    if isinstance(source, exp.Table):
+        info = _find_table(source, catalog)
+        return info.columns if info is not None else None
+    if isinstance(source, Scope) and isinstance(source.expression, exp.Query):
+        columns = {i.upper() for i in source.expression.named_selects}
+        if "*" in columns or not columns:
+            return None
+        return columns
+    return None
+
+
+def _is_resolvable(name: str, scope: Scope, catalog: list[TableInfo]) -> bool:
+    # Select aliases can be referenced in ORDER BY, GROUP BY and QUALIFY in Snowflake
+    if isinstance(scope.expression, exp.Select):
+        aliases = {
+            i.alias.upper()
+            for i in scope.expression.expressions
+            if isinstance(i, exp.Alias)
+        }
+        if name in aliases:
+            return True
+
+    # Unqualified columns in a correlated subquery may belong to an outer query
+    while scope is not None:
+        for source in scope.sources.values():
+            columns = _get_source_columns(source, catalog)
+            if columns is None or name in columns:
+                return True
+        scope = scope.parent
+    return False
+
+
+@lru_cache
+def get_sql_validator() -> SQLValidator:
+    return SQLValidator(config=settings.sql_validation, client=get_opensearch_client())
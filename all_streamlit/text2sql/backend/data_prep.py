@@ -1,8 +1,9 @@
 import re
 from dataclasses import dataclass, field
+from hashlib import blake2b
 from pathlib import Path
 
-from text2sql.backend.connectors.clients import get_openai_embedding_client
+from text2sql.backend.embedding_handler import embed_texts
 
 opensearch_property_type_text = {"opensearch_properties": {"type": "text"}}
 opensearch_property_type_vector = {
@@ -18,6 +19,8 @@ training_data_folder = f"{Path(__file__).parents[2]}/training_data"
 class DDL:
     opensearch_index_name = "ddl"
     display_name = "DDL"
+    embedding_source = "ddl"
+    embedding_field = "ddl_emb"
 
     ddl: str = field(metadata=opensearch_property_type_text)
     ddl_emb: list[float] = field(
@@ -29,6 +32,8 @@ class DDL:
 class Doc:
     opensearch_index_name = "doc"
     display_name = "Documentation"
+    embedding_source = "doc"
+    embedding_field = "doc_emb"
 
     doc: str = field(metadata=opensearch_property_type_text)
     doc_emb: list[float] = field(
@@ -40,6 +45,8 @@ class Doc:
 class QuestionSQL:
     opensearch_index_name = "question_sql"
     display_name = "Verified Questions & SQL"
+    embedding_source = "question"
+    embedding_field = "question_emb"
 
     question: str = field(metadata=opensearch_property_type_text)
     sql: str = field(metadata=opensearch_property_type_text)
@@ -71,31 +78,54 @@ def prepare_doc(doc: str) -> list:
     return doc_list
 
 
-def get_ddl(ddl: str) -> list[DDL]:
-    ddl_list = prepare_ddl(ddl)
-    ddl_embeddings = generate_embeddings(ddl_list)
-    output = [
-        DDL(ddl=ddl, ddl_emb=ddl_emb) for ddl, ddl_emb in zip(ddl_list, ddl_embeddings)
-    ]
-    return output
+def parse_ddl(ddl: str) -> list[DDL]:
+    return [DDL(ddl=i) for i in prepare_ddl(ddl)]
 
 
-def get_verified_questions(questions: str) -> list[QuestionSQL]:
+def parse_verified_questions(questions: str) -> list[QuestionSQL]:
     qn_list, sql_list = prepare_verified_questions(questions)
+    return [QuestionSQL(question=a, sql=b) for a, b in zip(qn_list, sql_list)]
+
+
+def parse_documentation(doc: str) -> list[Doc]:
+    return [Doc(doc=i) for i in prepare_doc(doc)]
+
 
-    embeddings = generate_embeddings(qn_list)
-    output = [
-        QuestionSQL(question=a, sql=b, question_emb=c)
-        for a, b, c in zip(qn_list, sql_list, embeddings)
-    ]
-    return output
+def get_ddl(ddl: str) -> list[DDL]:
+    return embed_documents(parse_ddl(ddl))
+
+
+def get_verified_questions(questions: str) -> list[QuestionSQL]:
+    return embed_documents(parse_verified_questions(questions))
 
 
 def get_documentation(doc: str) -> list[Doc]:
-    doc_list = prepare_doc(doc)
-    embeddings = generate_embeddings(doc_list)
-    output = [Doc(doc=i, doc_emb=j) for i, j in zip(doc_list, embeddings)]
-    return output
+    return embed_documents(parse_documentation(doc))
+
+
+def embed_documents(documents: list) -> list:
+    if documents:
+        embeddings = generate_embeddings(
+            [getattr(i, i.embedding_source) for i in documents]
+        )
+        for document, embedding in zip(documents, embeddings):
+            setattr(document, document.embedding_field, embedding)
+    return documents
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def get_document_id(document: dict) -> str:
+    # Derived from the text fields only, so the id is known before embedding and
+    # whitespace-only edits don't produce a new document
+    content = "\x1f".join(
+        f"{key}={normalize_text(value)}"
+        for key, value in sorted(document.items())
+        if isinstance(value, str)
+    )
+    return blake2b(content.encode("utf-8")).hexdigest()
 
 
 def generate_embeddings(texts: list[str]) -> list[list[float]]:
@@ -104,9 +134,5 @@ def generate_embeddings(texts: list[str]) -> list[list[float]]:
     # )
     # output = model.encode(texts).tolist()
     # SentenceTransformer hugging face has a certificate issue behind our corporate proxy
-    client = get_openai_embedding_client()
-    response = client.embeddings.create(input=texts, model="text-embedding-ada-002")
-    output = [i.embedding for i in response.data]
-
-    return output
+    return embed_texts(texts)
 
@@ -6,22 +6,125 @@ CREATE TABLE IF NOT EXISTS login_session (
     login_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- create chat history
+CREATE INDEX IF NOT EXISTS login_session_session_id_idx ON login_session (session_id);
+CREATE INDEX IF NOT EXISTS login_session_email_idx ON login_session (email, login_at);
+
+-- move a chat history table from before partitioning aside, it is copied over below
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('chat_history')) = 'r' THEN
+        ALTER TABLE chat_history RENAME TO chat_history_legacy;
+        ALTER SEQUENCE IF EXISTS chat_history_id_seq RENAME TO chat_history_legacy_id_seq;
+        ALTER INDEX IF EXISTS chat_history_pkey RENAME TO chat_history_legacy_pkey;
+    END IF;
+END $$;
+
+-- create chat history, partitioned by month on created_at
 CREATE TABLE IF NOT EXISTS chat_history (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     chat_id VARCHAR(255) NOT NULL,
     session_id VARCHAR(255) NOT NULL,
     email VARCHAR(255) NOT NULL,
     question VARCHAR,
     generated_sql VARCHAR,
     state VARCHAR(36),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    latency_ms INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cache_hit BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- catches rows for months that have no partition yet
+CREATE TABLE IF NOT EXISTS chat_history_default PARTITION OF chat_history DEFAULT;
+
+CREATE INDEX IF NOT EXISTS chat_history_chat_id_idx ON chat_history (chat_id);
+CREATE INDEX IF NOT EXISTS chat_history_session_id_idx ON chat_history (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_history_email_idx ON chat_history (email, created_at);
+CREATE INDEX IF NOT EXISTS chat_history_created_at_idx ON chat_history USING BRIN (created_at);
+
+-- create the partition for the month containing month_start, moving any rows for
+-- that month out of the default partition first
+CREATE OR REPLACE FUNCTION create_chat_history_partition(month_start DATE) RETURNS VOID AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month_start);
+    end_at DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::DATE;
+    partition_name TEXT := 'chat_history_' || to_char(date_trunc('month', month_start), 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE chat_history INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM chat_history_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        start_at, end_at, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE chat_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_at, end_at
+    );
+END $$ LANGUAGE plpgsql;
+
+-- copy the chat history from before partitioning
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    IF to_regclass('chat_history_legacy') IS NULL THEN
+        RETURN;
+    END IF;
+    FOR month_start IN
+        SELECT DISTINCT date_trunc('month', created_at)::DATE FROM chat_history_legacy
+        WHERE created_at IS NOT NULL
+    LOOP
+        PERFORM create_chat_history_partition(month_start);
+    END LOOP;
+    INSERT INTO chat_history (id, chat_id, session_id, email, question, generated_sql, state, created_at)
+    SELECT id, chat_id, session_id, email, question, generated_sql, state, COALESCE(created_at, CURRENT_TIMESTAMP)
+    FROM chat_history_legacy;
+    PERFORM setval(
+        pg_get_serial_sequence('chat_history', 'id'),
+        (SELECT COALESCE(MAX(id), 0) + 1 FROM chat_history),
+        false
+    );
+    DROP TABLE chat_history_legacy;
+END $$;
+
+-- create daily per-user rollup of chat history, kept after partitions are dropped
+CREATE TABLE IF NOT EXISTS chat_history_daily (
+    day DATE NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    questions INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    cache_hits INTEGER NOT NULL,
+    latency_ms_sum BIGINT NOT NULL,
+    latency_count INTEGER NOT NULL,
+    prompt_tokens BIGINT NOT NULL,
+    completion_tokens BIGINT NOT NULL,
+    feedback_count INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, email)
 );
 
--- create chat history
+CREATE INDEX IF NOT EXISTS chat_history_daily_email_idx ON chat_history_daily (email, day);
+
+-- create user feedback
 CREATE TABLE IF NOT EXISTS user_feedback (
     id SERIAL PRIMARY KEY,
     chat_id VARCHAR(255) NOT NULL,
     feedback VARCHAR(255),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS user_feedback_chat_id_idx ON user_feedback (chat_id);
+
+-- create embedding cache shared by all app replicas
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model VARCHAR(255) NOT NULL,
+    text_hash CHAR(64) NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, text_hash)
+);
@@ -0,0 +1,171 @@
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from text2sql.backend.config import settings
+from text2sql.backend.connectors.postgres import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+def get_text_hash(text: str) -> str:
+    return blake2b(text.encode("utf-8"), digest_size=32).hexdigest()
+
+
+def to_bytes(embedding: list[float] | np.ndarray) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class EmbeddingCache(ABC):
+    """Embeddings keyed by (model name, text hash), stored as float32 vectors."""
+
+    @abstractmethod
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, np.ndarray]: ...
+
+    @abstractmethod
+    def set_many(self, model: str, embeddings: dict[str, np.ndarray]) -> None: ...
+
+
+class MemoryEmbeddingCache(EmbeddingCache):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, np.ndarray]:
+        output = {}
+        with self._lock:
+            for text_hash in text_hashes:
+                key = (model, text_hash)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    output[text_hash] = self._entries[key]
+        return output
+
+    def set_many(self, model: str, embeddings: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for text_hash, embedding in embeddings.items():
+                self._entries[(model, text_hash)] = embedding
+                self._entries.move_to_end((model, text_hash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """Local stand-in for the shared tier, for tests and single-machine runs."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )"""
+            )
+            self._conn.commit()
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, np.ndarray]:
+        if not text_hashes:
+            return {}
+        placeholders = ",".join("?" * len(text_hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *text_hashes],
+            ).fetchall()
+        return {text_hash: from_bytes(data) for text_hash, data in rows}
+
+    def set_many(self, model: str, embeddings: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)",
+                [(model, i, to_bytes(j)) for i, j in embeddings.items()],
+            )
+            self._conn.commit()
+
+
+class PostgresEmbeddingCache(EmbeddingCache):
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, np.ndarray]:
+        if not text_hashes:
+            return {}
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT text_hash, embedding FROM embedding_cache WHERE model = %s AND text_hash = ANY(%s)",
+                    (model, text_hashes),
+                )
+                rows = cursor.fetchall()
+        return {text_hash: from_bytes(bytes(data)) for text_hash, data in rows}
+
+    def set_many(self, model: str, embeddings: dict[str, np.ndarray]) -> None:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    "INSERT INTO embedding_cache (model, text_hash, embedding) VALUES %s ON CONFLICT DO NOTHING",
+                    [(model, i, to_bytes(j)) for i, j in embeddings.items()],
+                )
+            conn.commit()
+
+
+class TieredEmbeddingCache(EmbeddingCache):
+    """Bounded in-process tier in front of an optional shared tier."""
+
+    def __init__(self, memory: MemoryEmbeddingCache, shared: EmbeddingCache | None):
+        self.memory = memory
+        self.shared = shared
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, np.ndarray]:
+        output = self.memory.get_many(model, text_hashes)
+        missing = [i for i in text_hashes if i not in output]
+
+        if missing and self.shared is not None:
+            try:
+                found = self.shared.get_many(model, missing)
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+                found = {}
+            self.memory.set_many(model, found)
+            output.update(found)
+
+        return output
+
+    def set_many(self, model: str, embeddings: dict[str, np.ndarray]) -> None:
+        self.memory.set_many(model, embeddings)
+
+        if self.shared is not None:
+            try:
+                self.shared.set_many(model, embeddings)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+
+@lru_cache
+def get_embedding_cache() -> EmbeddingCache:
+    config = settings.embedding_cache
+    memory = MemoryEmbeddingCache(max_entries=config.memory_max_entries)
+
+    match config.backend:
+        case "postgres":
+            shared = PostgresEmbeddingCache()
+        case "sqlite":
+            shared = SQLiteEmbeddingCache(config.sqlite_path)
+        case "none":
+            shared = None
+
+    return TieredEmbeddingCache(memory=memory, shared=shared)
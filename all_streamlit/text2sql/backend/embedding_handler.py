@@ -1,8 +1,30 @@
-from text2sql.backend.connectors.clients import get_openai_embedding_client
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 
+import numpy as np
+import tiktoken
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    AzureOpenAI,
+    RateLimitError,
+)
+
+from text2sql.backend.config import EmbeddingBatchSettings, settings
+from text2sql.backend.connectors.clients import (
+    get_async_openai_embedding_client,
+    get_openai_embedding_client,
+)
+from text2sql.backend.embedding_cache import get_embedding_cache, get_text_hash
+
+logger = logging.getLogger(__name__)
+
 
-@lru_cache
 def generate_embeddings_openai(
     input: str | tuple[str],
 ) -> list[float] | list[list[float]]:
@@ -11,15 +33,180 @@ def generate_embeddings_openai(
     # )
     # output = model.encode(texts).tolist()
     # SentenceTransformer hugging face has a certificate issue behind our corporate proxy
-    client = get_openai_embedding_client()
     if isinstance(input, str):
-        response = client.embeddings.create(input=input, model="text-embedding-ada-002")
-        output = response.data[0].embedding
+        output = embed_texts([input])[0]
     else:
-        list_input = list(input)
-        response = client.embeddings.create(
-            input=list_input, model="text-embedding-ada-002"
-        )
-        output = [i.embedding for i in response.data]
+        output = embed_texts(list(input))
 
     return output
+
+
+async def agenerate_embeddings_openai(input: str) -> list[float]:
+    return (await aembed_texts([input]))[0]
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    model = settings.azure_openai.embedding_model
+    cache = get_embedding_cache()
+
+    text_hashes = [get_text_hash(i) for i in texts]
+    embeddings = cache.get_many(model, list(set(text_hashes)))
+
+    missing = {j: i for i, j in zip(texts, text_hashes) if j not in embeddings}
+    if missing:
+        output = get_batch_embedder().embed(list(missing.values()))
+        new_embeddings = {
+            text_hash: np.asarray(i, dtype=np.float32)
+            for text_hash, i in zip(missing.keys(), output)
+        }
+        cache.set_many(model, new_embeddings)
+        embeddings.update(new_embeddings)
+
+    return [embeddings[i].tolist() for i in text_hashes]
+
+
+async def aembed_texts(texts: list[str]) -> list[list[float]]:
+    model = settings.azure_openai.embedding_model
+    cache = get_embedding_cache()
+
+    text_hashes = [get_text_hash(i) for i in texts]
+    # The caches are blocking, the embedding request is not
+    embeddings = await asyncio.to_thread(cache.get_many, model, list(set(text_hashes)))
+
+    missing = {j: i for i, j in zip(texts, text_hashes) if j not in embeddings}
+    if missing:
+        output = await get_batch_embedder().aembed(list(missing.values()))
+        new_embeddings = {
+            text_hash: np.asarray(i, dtype=np.float32)
+            for text_hash, i in zip(missing.keys(), output)
+        }
+        await asyncio.to_thread(cache.set_many, model, new_embeddings)
+        embeddings.update(new_embeddings)
+
+    return [embeddings[i].tolist() for i in text_hashes]
+
+
+class BatchEmbedder:
+    """Splits inputs into token- and item-bounded batches and embeds them concurrently."""
+
+    def __init__(
+        self,
+        client: AzureOpenAI,
+        model: str,
+        config: EmbeddingBatchSettings,
+        async_client: AsyncAzureOpenAI | None = None,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.config = config
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        inputs = [self._truncate(i) for i in texts]
+        batches = self._make_batches(inputs)
+        if len(batches) > 1:
+            logger.info(
+                f"Embedding {len(texts)} texts in {len(batches)} batches with concurrency {self.config.max_concurrency}"
+            )
+
+        # executor.map yields results in submission order, so output order matches input
+        with ThreadPoolExecutor(max_workers=self.config.max_concurrency) as executor:
+            results = executor.map(self._embed_batch, batches)
+            return [embedding for batch in results for embedding in batch]
+
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        batches = self._make_batches([self._truncate(i) for i in texts])
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self._aembed_batch(batch)
+
+        # gather returns results in submission order, so output order matches input
+        results = await asyncio.gather(*(embed_batch(i) for i in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    def _truncate(self, text: str) -> tuple[str, int]:
+        tokens = self.encoding.encode(text)
+        if len(tokens) > self.config.max_input_tokens:
+            logger.warning(
+                f"Embedding input truncated from {len(tokens)} to {self.config.max_input_tokens} tokens"
+            )
+            tokens = tokens[: self.config.max_input_tokens]
+            text = self.encoding.decode(tokens)
+        return text, len(tokens)
+
+    def _make_batches(self, inputs: list[tuple[str, int]]) -> list[list[str]]:
+        batches = []
+        batch = []
+        batch_tokens = 0
+
+        for text, n_tokens in inputs:
+            if batch and (
+                len(batch) >= self.config.max_items
+                or batch_tokens + n_tokens > self.config.max_tokens
+            ):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += n_tokens
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(input=texts, model=self.model)
+                return [i.embedding for i in response.data]
+            except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                if attempt == self.config.max_retries:
+                    raise
+                delay = _get_retry_after(e) or min(2**attempt, 60) + random.random()
+                logger.warning(
+                    f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+
+    async def _aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                response = await self.async_client.embeddings.create(
+                    input=texts, model=self.model
+                )
+                return [i.embedding for i in response.data]
+            except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                if attempt == self.config.max_retries:
+                    raise
+                delay = _get_retry_after(e) or min(2**attempt, 60) + random.random()
+                logger.warning(
+                    f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+
+def _get_retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache
+def get_batch_embedder() -> BatchEmbedder:
+    return BatchEmbedder(
+        client=get_openai_embedding_client(),
+        model=settings.azure_openai.embedding_model,
+        config=settings.embedding_batch,
+        async_client=get_async_openai_embedding_client(),
+    )
@@ -1,6 +1,7 @@
 import logging
 import os
 
+from text2sql.backend.chat_analytics import maintain_chat_history
 from text2sql.backend.connectors.clients import get_opensearch_client
 from text2sql.backend.connectors.postgres import get_db_connection
 from text2sql.backend.connectors.opensearch import (
@@ -34,6 +35,7 @@ def init_postgres() -> None:
                     cursor.execute(sql_script)
                     conn.commit()
         logger.info("Postgres Tables Established")
+        maintain_chat_history()
     except Exception as e:
         logger.error(e)
         raise e
@@ -1,5 +1,4 @@
 import logging
-from dataclasses import asdict
 from typing import Union
 
 import pandas as pd
@@ -16,14 +15,17 @@ from text2sql.backend.data_prep import (
     Doc,
     QuestionSQL,
     generate_embeddings,
-    get_ddl,
-    get_documentation,
     get_finance_context,
-    get_verified_questions,
+    parse_ddl,
+    parse_documentation,
+    parse_verified_questions,
 )
+from text2sql.backend.connectors.my_snowflake import fetch_all_dataframe
 from text2sql.backend.connectors.opensearch import (
-    index_dococument,
+    sync_documents,
 )
+from text2sql.backend.core.semantic_cache import get_semantic_cache
+from text2sql.backend.core.sql_validator import get_sql_validator
 from text2sql.backend.vanna_setup.vector_store import OpenSearch_VectorStore
 from text2sql.frontend.auth import auth_by_refresh_token
 
@@ -80,12 +82,7 @@ class MyVanna(OpenSearch_VectorStore, OpenAI_Chat):
 
             cur = cs.execute(sql)
 
-            results = cur.fetchall()
-
-            # Create a pandas dataframe from the results
-            df = pd.DataFrame(results, columns=[desc[0] for desc in cur.description])
-
-            return df
+            return fetch_all_dataframe(cur)
 
         self.dialect = "Snowflake SQL"
         self.run_sql = run_sql_snowflake
@@ -233,20 +230,22 @@ def upload_user_training_data(client: OpenSearch, uploaded_file, file_type):
     match file_type:
         case DDL.display_name:
             index = DDL.opensearch_index_name
-            output = get_ddl(uploaded_file)
+            output = parse_ddl(uploaded_file)
         case Doc.display_name:
             index = Doc.opensearch_index_name
-            output = get_documentation(uploaded_file)
+            output = parse_documentation(uploaded_file)
         case QuestionSQL.display_name:
             index = QuestionSQL.opensearch_index_name
-            output = get_verified_questions(uploaded_file)
+            output = parse_verified_questions(uploaded_file)
 
     for index_name, data in zip([index], [output]):
-        data_list_dict = [asdict(i) for i in data]
-        summary = index_dococument(client, index, data_list_dict)
+        summary = sync_documents(client, index, data)
         logger.info(f"Index: {index_name} data uploaded")
         st.session_state.upload_summary = summary
 
+    # Cached answers may rely on training data that just changed
+    get_semantic_cache().invalidate()
+
 
 @st.cache_resource(ttl=3600)
 def setup_vanna():
@@ -288,7 +287,7 @@ def generate_sql_cached(question: str):
 def is_sql_valid_cached(sql: str):
     # vn = setup_vanna()
     # return vn.is_sql_valid(sql=sql)
-    return "SELECT" in sql.upper()
+    return get_sql_validator().validate(sql).valid
 
 
 @st.cache_data(show_spinner="Running SQL query ...")
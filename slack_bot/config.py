@@ -14,13 +14,32 @@ class OpenAI(BaseSettings):
     api_version: str = "2024-02-15"
 
 
+class Redis(BaseSettings):
+    host: str = "localhost"
+    port: int = 6379
+    db: int = 0
+    username: Optional[str] = None
+    password: Optional[str] = None
+    ssl: bool = False
+    ssl_ca_certs: Optional[str] = None
+    # Shared by all sessions; callers wait for a free connection beyond this
+    max_connections: int = 50
+    pool_timeout_seconds: float = 5.0
+    socket_timeout_seconds: float = 5.0
+
+    model_config = SettingsConfigDict(
+        env_prefix="redis__", env_file=".env", extra="ignore"
+    )
+
+
 class Settings(BaseSettings):
     slack_bot_token: str
     slack_app_token: str
 
     openai: Optional[OpenAI] = None
+    redis: Redis = Redis()
 
-    model_config = SettingsConfigDict(env_file=".env")
+    model_config = SettingsConfigDict(env_file=".env", env_nested_delimiter="__")
 
 
 settings = Settings()
@@ -9,7 +9,7 @@ from message_converter import (
     get_message_with_role,
     get_new_thread_messages,
 )
-from slack_bot import app, get_session, get_response
+from slack_bot import Session, app, get_session, get_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -43,7 +43,7 @@ async def mention_handler(body, say, client, logger):
                 messages_to_add
             )
             # print("old message", model_messages_to_add)
-            session.append_message(model_messages_to_add)
+            await session.append_message(model_messages_to_add)
 
     # Get response using the full thread context
     input_text = get_message_with_role(event)
@@ -51,8 +51,10 @@ async def mention_handler(body, say, client, logger):
         input_text=input_text,
         session=session,
     )
-    session_messages = session.get_messages()
-    logger.debug(f"session messages: {session_messages}")
+    if logger.isEnabledFor(logging.DEBUG):
+        # Costs a Redis round trip, so only fetched when it will be logged
+        session_messages = await session.get_messages()
+        logger.debug(f"session messages: {session_messages}")
     await say(text=output, thread_ts=thread_ts)
 
     # Update the latest message timestamp
@@ -61,6 +63,7 @@ async def mention_handler(body, say, client, logger):
 
 async def main():
     """Start the Slack bot."""
+    await Session.check_connection()
     await AsyncSocketModeHandler(app, settings.slack_app_token).start_async()
 
 
@@ -1,6 +1,7 @@
 import asyncio
+import json
 import logging
-import redis
+import redis.asyncio as redis
 from functools import lru_cache
 from typing import Optional
 
@@ -20,51 +21,78 @@ app = AsyncApp(token=settings.slack_bot_token)
 class Session:
     """Session manager for storing conversation history in Redis."""
 
-    # Class-level Redis client shared by all instances
-    _redis_client: Optional[redis.Redis] = None
+    # Class-level connection pool shared by all sessions
+    _connection_pool: Optional[redis.BlockingConnectionPool] = None
 
     @classmethod
-    def _get_redis_client(cls) -> redis.Redis:
-        """Get or create Redis client."""
-        if cls._redis_client is None:
-            cls._redis_client = redis.Redis(
-                host="localhost", port=6379, decode_responses=True
+    def _get_connection_pool(cls) -> redis.BlockingConnectionPool:
+        """Get or create the Redis connection pool."""
+        if cls._connection_pool is None:
+            config = settings.redis
+            kwargs = {}
+            if config.ssl:
+                kwargs = {
+                    "connection_class": redis.SSLConnection,
+                    "ssl_ca_certs": config.ssl_ca_certs,
+                }
+            cls._connection_pool = redis.BlockingConnectionPool(
+                host=config.host,
+                port=config.port,
+                db=config.db,
+                username=config.username,
+                password=config.password,
+                max_connections=config.max_connections,
+                timeout=config.pool_timeout_seconds,
+                socket_timeout=config.socket_timeout_seconds,
+                decode_responses=True,
+                **kwargs,
             )
-            try:
-                cls._redis_client.ping()
-                logger.info("Connected to Redis")
-            except redis.ConnectionError:
-                raise Exception("Redis connection error")
-        return cls._redis_client
+        return cls._connection_pool
+
+    @classmethod
+    async def check_connection(cls) -> None:
+        """Ping Redis once at startup so a bad configuration fails fast."""
+        try:
+            await redis.Redis(connection_pool=cls._get_connection_pool()).ping()
+            logger.info("Connected to Redis")
+        except redis.ConnectionError:
+            raise Exception("Redis connection error")
 
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.redis_client = self._get_redis_client()
+        self.redis_client = redis.Redis(connection_pool=self._get_connection_pool())
         self.latest_message_ts: Optional[str] = None
 
-    def get_messages(self) -> list[ModelMessage]:
+    async def get_messages(self) -> list[ModelMessage]:
         """Get messages from Redis for this session."""
-        messages_json = self.redis_client.json().get(self.session_id)
+        messages_json = await self.redis_client.json().get(self.session_id)
         if not messages_json:
             return []
         else:
             return ModelMessagesTypeAdapter.validate_python(messages_json)
 
-    def append_message(self, messages: list[ModelMessage]) -> None:
+    async def append_message(self, messages: list[ModelMessage]) -> None:
         """Append messages to the session in Redis."""
         messages_json = to_jsonable_python(messages)
+        if not messages_json:
+            return
+
+        # Create the array if the session is new and append to it, in one round trip
+        # and one MULTI/EXEC so concurrent appends to the same thread can't interleave
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.execute_command("JSON.SET", self.session_id, "$", "[]", "NX")
+            pipe.execute_command(
+                "JSON.ARRAPPEND",
+                self.session_id,
+                "$",
+                *(json.dumps(i) for i in messages_json),
+            )
+            await pipe.execute()
+        logger.debug(f"Appended values in Redis: {messages_json}")
 
-        if self.is_new():
-            # Initialize with the messages at root level to avoid extra nesting
-            self.redis_client.json().set(self.session_id, ".", messages_json)
-            logger.debug("Session initialized in Redis")
-        else:
-            self.redis_client.json().arrappend(self.session_id, ".", *messages_json)
-            logger.debug(f"Appended values in Redis: {messages_json}")
-
-    def is_new(self) -> bool:
+    async def is_new(self) -> bool:
         """Check if this is a new session."""
-        return not self.redis_client.exists(self.session_id)
+        return not await self.redis_client.exists(self.session_id)
 
     def set_latest_message_ts(self, timestamp: str) -> None:
         """Set the latest message timestamp for this session."""
@@ -113,14 +141,14 @@ async def get_response(input_text: str, session: Session) -> str:
     """Get response from the AI agent using session context."""
     from agent import get_agent
 
-    session_messages = session.get_messages()
+    session_messages = await session.get_messages()
     # Filter out None values
     valid_messages = [msg for msg in session_messages if msg is not None]
 
     bot_user_id = await get_bot_user_id()
     agent = await get_agent(bot_user_id)
     output = await agent.run(input_text, message_history=valid_messages)
-    session.append_message(output.new_messages())
+    await session.append_message(output.new_messages())
 
     return output.output
 
@@ -129,7 +157,7 @@ if __name__ == "__main__":
 
     async def main():
         session = Session("123")
-        session.redis_client.json().delete("123", "$")
+        await session.redis_client.json().delete("123", "$")
 
         response1 = await get_response("tell me joke", session)
         print(response1)
@@ -137,7 +165,7 @@ if __name__ == "__main__":
         response2 = await get_response("explain", session)
         print(response2)
 
-        output = session.get_messages()
+        output = await session.get_messages()
         print(output)
 
     import asyncio